@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Import et recherche dans un carnet d'adresses de --count adresses synthétiques.
+#
+#   python benchmarks/bench_addressbook.py --count 100000
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, BENCH_DIR)
+
+import envejp
+import corpus
+
+QUERIES = ["山", "山田", "藤原", "さくら", "東京都", "桜丘町 7", "八王子 山田", "abc trading", "人事 藤原", "東 zz", "東京都 zz"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Import et latence de recherche du carnet d'adresses")
+    parser.add_argument("--count", type=int, default=100000, help="Nombre d'adresses")
+    parser.add_argument("--runs", type=int, default=50, help="Recherches par requête")
+    args = parser.parse_args()
+
+    records = corpus.generate(args.count)
+    with tempfile.TemporaryDirectory() as tmp:
+        with envejp.AddressBook(os.path.join(tmp, "bench.db")) as book:
+            start = time.perf_counter()
+            book.import_records(records)
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(book.path)
+            print(f"import: {args.count} adresses en {elapsed:.2f} s ({args.count / elapsed:.0f}/s), "
+                  f"{size / 1e6:.1f} Mo")
+            print(f"{'requête':<14} {'résultats':>9} {'p50 (ms)':>9} {'max (ms)':>9}")
+            for query in QUERIES:
+                samples = []
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    results = book.search(query)
+                    samples.append(time.perf_counter() - start)
+                samples.sort()
+                print(f"{query:<14} {len(results):>9} {samples[len(samples) // 2] * 1000:>9.2f} "
+                      f"{samples[-1] * 1000:>9.2f}")
+
+if __name__ == "__main__":
+    main()
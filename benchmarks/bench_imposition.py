@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Compare une page A5 par enveloppe et l'imposition sur les modèles de feuille
+# (nombre de pages, taille du fichier, durée).
+#
+#   python benchmarks/bench_imposition.py --count 5000
+
+import os
+import sys
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, BENCH_DIR)
+
+import envejp
+import corpus
+
+def main():
+    parser = argparse.ArgumentParser(description="Pages et taille du PDF selon le modèle de feuille")
+    parser.add_argument("--count", type=int, default=5000, help="Nombre d'enveloppes")
+    args = parser.parse_args()
+
+    envejp.setup_font_headless()
+    records = corpus.generate(args.count)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "bench.pdf")
+        count, elapsed = envejp.render_batch(records, output, progress_every=0)
+        base_pages, base_size = count, os.path.getsize(output)
+        print(f"{'modèle':<10} {'pages':>7} {'taille (Mo)':>12} {'durée (s)':>10} {'pages':>8} {'taille':>8}")
+        print(f"{'A5':<10} {base_pages:>7} {base_size / 1e6:>12.2f} {elapsed:>10.2f} {'1.00x':>8} {'1.00x':>8}")
+        for template in envejp.SHEET_TEMPLATES:
+            count, pages, elapsed = envejp.render_sheets(records, output, template, progress_every=0)
+            size = os.path.getsize(output)
+            print(f"{template:<10} {pages:>7} {size / 1e6:>12.2f} {elapsed:>10.2f} "
+                  f"{pages / base_pages:>7.2f}x {size / base_size:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Compare taille et temps de rendu avec la grille du code postal dessinée sur
+# chaque page ou partagée dans un Form XObject.
+#
+#   python benchmarks/bench_postal_form.py --pages 1000 10000
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import io
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A5
+
+import envejp
+from bench_workers import SAMPLE
+
+def render(path, pages, use_forms):
+    start = time.perf_counter()
+    c = canvas.Canvas(path, pagesize=A5)
+    for _ in range(pages):
+        envejp.draw_envelope(c, SAMPLE, use_forms=use_forms)
+        c.showPage()
+    c.save()
+    return time.perf_counter() - start, os.path.getsize(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Grille du code postal : dessin par page ou Form XObject")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        envejp.setup_font_headless()
+        envejp.ensure_japanese_font()
+
+    print(f"{'pages':>7} {'mode':>6} {'durée (s)':>10} {'ms/page':>8} {'taille (ko)':>12} {'octets/page':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            for label, use_forms in (("direct", False), ("form", True)):
+                elapsed, size = render(os.path.join(tmp, f"{label}.pdf"), pages, use_forms)
+                print(f"{pages:>7} {label:>6} {elapsed:>10.2f} {elapsed / pages * 1000:>8.3f} "
+                      f"{size / 1024:>12.1f} {size / pages:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Tri postal et dédoublonnage (sous-commande presort) d'un fichier de --count
+# adresses synthétiques, dont --duplicates en doublons réécrits autrement
+# (espaces, pleine chasse). Chaque mesure tourne dans son propre processus
+# pour que le pic de mémoire (RSS) soit le sien.
+#
+#   python benchmarks/bench_presort.py --count 1000000
+
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import envejp
+import corpus
+
+FULLWIDTH = str.maketrans({chr(code): chr(code + 0xFEE0) for code in range(0x21, 0x7F)})
+
+def write_input(path, count, duplicates, seed=0):
+    """Écrit count adresses, dont une part duplicates de copies d'adresses déjà écrites"""
+    rng = random.Random(seed)
+    originals = []
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, envejp.ADDRESS_FIELDS)
+        writer.writeheader()
+        for _ in range(count):
+            if originals and rng.random() < duplicates:
+                record = dict(rng.choice(originals))
+                record["address1"] = record["address1"].replace(" ", "").translate(FULLWIDTH)
+                record["recipient"] = record["recipient"].replace("様", " 様")
+            else:
+                record = corpus.random_address(rng)
+                # Un échantillon suffit pour tirer les doublons
+                if len(originals) < 100000:
+                    originals.append(record)
+                else:
+                    originals[rng.randrange(len(originals))] = record
+            writer.writerow(record)
+
+def run_presort(args):
+    """Lance presort dans un processus ; retourne (durée en s, pic RSS en Ko, sortie)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, "envejp.py"), "presort", *args],
+                            stdout=subprocess.PIPE, text=True)
+    output = proc.stdout.read()
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        rss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    else:  # Windows
+        proc.wait()
+        rss = None
+    if proc.returncode:
+        raise RuntimeError(f"presort a échoué ({proc.returncode})")
+    return time.perf_counter() - start, rss, output
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit et mémoire du tri postal avec dédoublonnage")
+    parser.add_argument("--count", type=int, default=1000000, help="Nombre d'adresses")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Part de doublons (défaut: 0.1)")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[50000, envejp.PRESORT_CHUNK, 10 ** 9],
+                        help="Tailles de paquet à comparer (10**9 = tout en mémoire)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "input.csv")
+        start = time.perf_counter()
+        write_input(source, args.count, args.duplicates)
+        print(f"{args.count} adresses ({os.path.getsize(source) / 1e6:.0f} Mo) générées "
+              f"en {time.perf_counter() - start:.1f} s")
+        print(f"{'paquet':>10} {'paquets':>8} {'durée (s)':>10} {'adresses/s':>11} {'pic RSS':>9} {'gardées':>9}")
+        for chunk_size in args.chunk_sizes:
+            output = os.path.join(tmp, "sorted.csv")
+            elapsed, rss, report = run_presort([source, "-o", output, "--chunk-size", str(chunk_size),
+                                                "--groups", os.path.join(tmp, "groups.csv")])
+            runs = report.split("(")[-1].split()[0]
+            kept = report.split()[0]
+            rss_text = f"{rss / 1024:.0f} Mo" if rss else "?"
+            print(f"{chunk_size:>10} {runs:>8} {elapsed:>10.2f} {args.count / elapsed:>11.0f} "
+                  f"{rss_text:>9} {kept:>9}")
+
+if __name__ == "__main__":
+    main()
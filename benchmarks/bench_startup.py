@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Mesure le lancement : import du module (python -X importtime), puis
+# découverte des polices avec un cache vide (froid) et rempli (chaud).
+#
+#   python benchmarks/bench_startup.py
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import envejp
+
+def import_times(module="envejp", runs=5):
+    """Durées d'import cumulées (ms) par module, meilleure de runs exécutions à froid"""
+    best = {}
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              capture_output=True, text=True, cwd=ROOT_DIR, check=True)
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, raw_name = line[len("import time:"):].split("|")
+            name = raw_name.strip()
+            # Deux espaces d'indentation par niveau : on garde le module et ses imports directs
+            depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+            if depth <= 1:
+                ms = int(cumulative) / 1000
+                best[name] = min(best.get(name, ms), ms)
+    return best
+
+def timed_discovery():
+    # Repartir d'un cache relu depuis le disque, comme un nouveau lancement
+    envejp._font_cache = None
+    envejp._selected_font_path = envejp._registered_font_path = None
+    start = time.perf_counter()
+    font_path = envejp.setup_font_headless()
+    discovery = time.perf_counter() - start
+    start = time.perf_counter()
+    envejp.ensure_japanese_font()
+    first_render = time.perf_counter() - start
+    return font_path, discovery, first_render
+
+def main():
+    times = import_times()
+    print(f"import envejp: {times.get('envejp', 0):.1f} ms (meilleur de 5, python -X importtime)")
+    heaviest = sorted((item for item in times.items() if item[0] != "envejp"),
+                      key=lambda item: -item[1])[:5]
+    for name, ms in heaviest:
+        print(f"    {name:<24} {ms:>7.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ENVEJP_CACHE_DIR"] = tmp
+        font_path, cold, cold_load = timed_discovery()
+        _, warm, warm_load = timed_discovery()
+
+    print(f"Police: {font_path}")
+    print(f"{'':>6} {'découverte (ms)':>16} {'chargement au 1er rendu (ms)':>29}")
+    print(f"{'froid':>6} {cold * 1000:>16.1f} {cold_load * 1000:>29.1f}")
+    print(f"{'chaud':>6} {warm * 1000:>16.1f} {warm_load * 1000:>29.1f}")
+
+if __name__ == "__main__":
+    main()
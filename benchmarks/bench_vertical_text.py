@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Compare le rendu des lignes verticales : un drawString par caractère
+# (ancienne méthode) ou un seul objet texte par ligne.
+#
+#   python benchmarks/bench_vertical_text.py --pages 2000
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import io
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from reportlab import rl_config
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A5
+
+import envejp
+from bench_workers import SAMPLE
+
+def draw_vertical_line_per_glyph(c, x, y, text, steps, font_size):
+    """Ancienne boucle de create_pdf : un bloc BT/ET par caractère"""
+    c.setFont(envejp.FONT_NAME, font_size)
+    for char, step in zip(text, steps):
+        c.drawString(x, y, char)
+        y -= step
+
+def render(path, pages):
+    start = time.perf_counter()
+    c = canvas.Canvas(path, pagesize=A5)
+    for _ in range(pages):
+        envejp.draw_envelope(c, SAMPLE)
+        c.showPage()
+    c.save()
+    return time.perf_counter() - start, os.path.getsize(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Lignes verticales : drawString par caractère ou objet texte")
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--uncompressed", action="store_true",
+                        help="Désactive la compression des pages pour voir la taille brute du flux")
+    args = parser.parse_args()
+
+    if args.uncompressed:
+        rl_config.pageCompression = 0
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        envejp.setup_font_headless()
+        envejp.ensure_japanese_font()
+
+    text_object = envejp.draw_vertical_line
+    print(f"{'mode':>10} {'ms/enveloppe':>13} {'octets/enveloppe':>17}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, func in (("par glyphe", draw_vertical_line_per_glyph), ("objet texte", text_object)):
+            envejp.draw_vertical_line = func
+            elapsed, size = render(os.path.join(tmp, "bench.pdf"), args.pages)
+            print(f"{label:>10} {elapsed / args.pages * 1000:>13.3f} {size / args.pages:>17.1f}")
+    envejp.draw_vertical_line = text_object
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Mesure le débit du rendu parallèle de 1 à N processus.
+#
+#   python benchmarks/bench_workers.py --count 5000 --max-workers 8
+
+import os
+import sys
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import envejp
+
+SAMPLE = {
+    "postal_code": "〒160ｰ0007",
+    "address1": "東京都新宿区 荒木町11-1",
+    "address2": "ハイム石川8号",
+    "company": "ステファン ビーディーシーLTD.",
+    "recipient": "経理・藤原様",
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit du rendu parallèle selon le nombre de workers")
+    parser.add_argument("--count", type=int, default=4000, help="Nombre d'enveloppes par mesure")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count(), help="Nombre maximum de workers")
+    parser.add_argument("--shard-size", type=int, default=250)
+    args = parser.parse_args()
+
+    font_path = envejp.setup_font_headless()
+    records = [SAMPLE] * args.count
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "bench.pdf")
+        baseline = None
+        print(f"{'workers':>8} {'durée (s)':>10} {'env/s':>10} {'accélération':>13}")
+        for workers in range(1, args.max_workers + 1):
+            count, elapsed, _ = envejp.render_parallel(records, output, font_path,
+                                                       workers=workers,
+                                                       shard_size=args.shard_size,
+                                                       split=True)
+            rate = count / elapsed
+            baseline = baseline or rate
+            print(f"{workers:>8} {elapsed:>10.2f} {rate:>10.1f} {rate / baseline:>12.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# Générateur d'adresses japonaises synthétiques pour les benchmarks.
+# Déterministe : une même graine donne toujours le même corpus.
+
+import random
+
+PREFECTURES = [
+    ("東京都", ["新宿区", "千代田区", "渋谷区", "港区", "世田谷区", "八王子市"]),
+    ("大阪府", ["大阪市北区", "大阪市中央区", "堺市堺区", "豊中市"]),
+    ("北海道", ["札幌市中央区", "函館市", "旭川市"]),
+    ("神奈川県", ["横浜市西区", "川崎市川崎区", "鎌倉市"]),
+    ("愛知県", ["名古屋市中区", "豊田市", "岡崎市"]),
+    ("福岡県", ["福岡市博多区", "北九州市小倉北区"]),
+    ("沖縄県", ["那覇市", "沖縄市"]),
+]
+
+TOWNS = ["荒木町", "梅田", "北一条西", "栄", "天神", "港町", "本町", "緑町", "桜丘町", "日本橋"]
+BUILDINGS = ["ハイム石川", "グランドメゾン", "サンシャインビル", "コーポ山田", "第一ビル", "パークタワー"]
+COMPANIES = ["株式会社テスト", "ステファン ビーディーシーLTD.", "有限会社山田商店", "合同会社サクラ",
+             "株式会社ロングネームカンパニー", "ﾃｽﾄ ｶﾌﾞｼｷｶﾞｲｼｬ", "ABC TRADING CO., LTD."]
+DEPARTMENTS = ["経理", "総務部", "営業部", "人事部", ""]
+NAMES = ["藤原", "山田太郎", "佐藤", "鈴木一郎", "高橋", "田中花子", "渡辺"]
+
+# Longueur maximale de ligne par corpus (tranches de taille de l'ancienne mise en page, par nombre de caractères)
+TIERS = {
+    "tier_14": 16,
+    "tier_12": 20,
+    "tier_10": 24,
+    "tier_9": 28,
+    "tier_8": 35,
+}
+
+PADDING = "丁目番地号棟階室"
+
+def fit(text, length, rng):
+    """Tronque ou complète text pour obtenir exactement length caractères"""
+    while len(text) < length:
+        text += rng.choice(PADDING)
+    return text[:length]
+
+def random_address(rng):
+    prefecture, cities = rng.choice(PREFECTURES)
+    number = f"{rng.randint(1, 9)}-{rng.randint(1, 30)}"
+    department = rng.choice(DEPARTMENTS)
+    name = rng.choice(NAMES) + "様"
+    return {
+        "postal_code": f"〒{rng.randint(100, 999)}ｰ{rng.randint(0, 9999):04d}",
+        "address1": f"{prefecture}{rng.choice(cities)} {rng.choice(TOWNS)}{number}",
+        "address2": f"{rng.choice(BUILDINGS)}{rng.randint(1, 20)}号" if rng.random() < 0.7 else "",
+        "company": rng.choice(COMPANIES),
+        "recipient": f"{department}・{name}" if department else name,
+    }
+
+def generate(count, max_length=None, seed=0):
+    """Génère count adresses ; avec max_length, la ligne 1 fait exactement
+    max_length caractères et les autres lignes au plus max_length."""
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        record = random_address(rng)
+        if max_length:
+            record["address1"] = fit(record["address1"], max_length, rng)
+            for field in ("address2", "company", "recipient"):
+                record[field] = record[field][:max_length]
+        records.append(record)
+    return records
+
+def corpora(count, seed=0):
+    """Corpus nommés : un par tranche de taille de police, plus court/long/débordant"""
+    named = {
+        "short": generate(count, 10, seed),
+        "mixed": generate(count, None, seed),
+        "long": generate(count, 40, seed),
+        # Assez long pour être coupé par margin_bottom quelle que soit la ligne
+        "overflow": generate(count, 80, seed),
+    }
+    for name, length in TIERS.items():
+        named[name] = generate(count, length, seed)
+    return named
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Suite de benchmarks sans interface : démarrage, mise en page, rendu et
+# validation, sur des corpus d'adresses synthétiques (voir corpus.py).
+#
+#   python benchmarks/suite.py -o results.json
+#   python benchmarks/suite.py -o new.json --compare results.json
+#
+# Chaque scénario tourne dans un processus séparé pour que le pic de mémoire
+# (RSS) mesuré soit le sien. Avec --compare, les métriques qui se dégradent de
+# plus de --threshold sont signalées et le code de sortie vaut 1.
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import corpus
+
+# Sens d'amélioration de chaque métrique : -1 = plus petit est mieux, +1 = plus grand est mieux
+METRICS = {
+    "import_ms": -1,
+    "cold_ms": -1,
+    "warm_ms": -1,
+    "latency_p50_ms": -1,
+    "latency_p95_ms": -1,
+    "latency_p99_ms": -1,
+    "throughput_per_s": 1,
+    "bytes_per_envelope": -1,
+    "peak_rss_kb": -1,
+}
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sur macOS, en kilo-octets sur Linux
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def percentiles(samples):
+    samples = sorted(samples)
+    def pick(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return {
+        "latency_p50_ms": pick(0.50),
+        "latency_p95_ms": pick(0.95),
+        "latency_p99_ms": pick(0.99),
+        "latency_mean_ms": statistics.fmean(samples) * 1000,
+    }
+
+def quiet_font_setup(envejp):
+    envejp.setup_font_headless()
+    envejp.ensure_japanese_font()
+
+# Scénarios, exécutés dans le processus enfant ---------------------------------
+
+def scenario_startup(count):
+    from bench_startup import import_times
+    import_ms = import_times(runs=3).get("envejp")
+    import envejp
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ENVEJP_CACHE_DIR"] = tmp
+        timings = []
+        for _ in range(2):
+            envejp._font_cache = None
+            start = time.perf_counter()
+            envejp.setup_font_headless()
+            timings.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        envejp.ensure_japanese_font()
+        load_ms = (time.perf_counter() - start) * 1000
+    return {"import_ms": import_ms, "cold_ms": timings[0], "warm_ms": timings[1], "font_load_ms": load_ms}
+
+def scenario_layout(count, name):
+    import envejp
+    records = corpus.corpora(count)[name]
+    samples = []
+    for record in records:
+        start = time.perf_counter()
+        envejp.layout_envelope(record)
+        samples.append(time.perf_counter() - start)
+    result = percentiles(samples)
+    result["throughput_per_s"] = len(samples) / sum(samples)
+    return result
+
+def scenario_validate(count, name):
+    import envejp
+    records = corpus.corpora(count)[name]
+    samples = []
+    for record in records:
+        start = time.perf_counter()
+        envejp.validate_address(record)
+        samples.append(time.perf_counter() - start)
+    result = percentiles(samples)
+    result["throughput_per_s"] = len(samples) / sum(samples)
+    return result
+
+def scenario_validate_bulk(count, name):
+    """validate_records sur tout le corpus d'un coup (le rapport de la sous-commande validate)"""
+    import envejp
+    records = corpus.corpora(count)[name]
+    # Assez d'adresses pour que la mesure ne soit pas dominée par le bruit
+    repeat = max(1, 20000 // len(records))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _ in envejp.validate_records(records):
+            pass
+    total = time.perf_counter() - start
+    return {"throughput_per_s": len(records) * repeat / total}
+
+# La normalisation est mesurée sur un gros fichier, indépendamment de --count
+NORMALIZE_COUNT = 100000
+
+def scenario_normalize(count):
+    """normalize_records sur NORMALIZE_COUNT adresses du corpus mélangé"""
+    import envejp
+    quiet_font_setup(envejp)
+    records = corpus.generate(NORMALIZE_COUNT)
+    advances = envejp.current_advances()
+    envejp.normalize_records(records[:100], advances)
+    start = time.perf_counter()
+    envejp.normalize_records(records, advances)
+    total = time.perf_counter() - start
+    return {"throughput_per_s": len(records) / total}
+
+def scenario_render(count, name):
+    import envejp
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A5
+
+    quiet_font_setup(envejp)
+    records = corpus.corpora(count)[name]
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.pdf")
+        start_total = time.perf_counter()
+        c = canvas.Canvas(path, pagesize=A5)
+        for record in records:
+            start = time.perf_counter()
+            envejp.draw_envelope(c, record)
+            c.showPage()
+            samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        c.save()
+        save_s = time.perf_counter() - start
+        total = time.perf_counter() - start_total
+        size = os.path.getsize(path)
+
+    result = percentiles(samples)
+    result.update({
+        "throughput_per_s": len(records) / total,
+        "save_ms": save_s * 1000,
+        "output_bytes": size,
+        "bytes_per_envelope": size / len(records),
+    })
+    return result
+
+def scenario_names():
+    names = ["startup", "normalize"]
+    for kind in ("layout", "render", "validate", "validate_bulk"):
+        for corpus_name in corpus.corpora(1):
+            names.append(f"{kind}:{corpus_name}")
+    return names
+
+def run_scenario(name, count):
+    if name == "startup":
+        result = scenario_startup(count)
+    elif name == "normalize":
+        result = scenario_normalize(count)
+    else:
+        kind, corpus_name = name.split(":", 1)
+        result = {"layout": scenario_layout, "render": scenario_render,
+                  "validate": scenario_validate,
+                  "validate_bulk": scenario_validate_bulk}[kind](count, corpus_name)
+    result["peak_rss_kb"] = peak_rss_kb()
+    return result
+
+# Orchestration -----------------------------------------------------------------
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(names, count):
+    """Lance chaque scénario dans un processus à part ; retourne (résultats, scénarios en échec)"""
+    import reportlab
+    results = {}
+    failures = []
+    for name in names:
+        # fonts/ est cherché depuis le répertoire courant (voir resource_path)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-scenario", name,
+                               "--count", str(count)], capture_output=True, text=True, cwd=ROOT_DIR)
+        if proc.returncode != 0:
+            error = (proc.stderr.strip().splitlines() or ["?"])[-1]
+            print(f"{name:<18} ÉCHEC: {error}", file=sys.stderr)
+            failures.append(name)
+            continue
+        results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(format_line(name, results[name]))
+    return {
+        "failures": failures,
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "reportlab": reportlab.Version,
+            "platform": platform.platform(),
+            "count": count,
+        },
+        "scenarios": results,
+    }
+
+def format_line(name, result):
+    parts = [f"{name:<18}"]
+    for key in ("import_ms", "cold_ms", "warm_ms", "latency_p50_ms", "latency_p95_ms"):
+        if key in result:
+            parts.append(f"{key}={result[key]:.3f}")
+    if "throughput_per_s" in result:
+        parts.append(f"débit={result['throughput_per_s']:.0f}/s")
+    if "bytes_per_envelope" in result:
+        parts.append(f"octets/env={result['bytes_per_envelope']:.0f}")
+    if result.get("peak_rss_kb"):
+        parts.append(f"rss={result['peak_rss_kb'] / 1024:.1f}Mo")
+    return " ".join(parts)
+
+def compare(current, previous, threshold):
+    """Retourne la liste des régressions (scénario, métrique, avant, après, variation)"""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        before = previous["scenarios"].get(name)
+        if not before:
+            continue
+        for metric, direction in METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction < -threshold:
+                regressions.append((name, metric, old, new, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks envejp")
+    parser.add_argument("-o", "--output", help="Fichier JSON de résultats")
+    parser.add_argument("--compare", metavar="JSON", help="Résultats précédents à comparer")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Dégradation relative tolérée avant de signaler une régression (défaut: 0.10)")
+    parser.add_argument("--count", type=int, default=1000, help="Adresses par scénario")
+    parser.add_argument("--only", nargs="+", metavar="SCÉNARIO",
+                        help="Scénarios à lancer (préfixe accepté, ex. render)")
+    parser.add_argument("--list", action="store_true", help="Liste les scénarios")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        print(json.dumps(run_scenario(args.run_scenario, args.count)))
+        return 0
+
+    names = scenario_names()
+    if args.list:
+        print("\n".join(names))
+        return 0
+    if args.only:
+        names = [name for name in names if any(name.startswith(prefix) for prefix in args.only)]
+
+    current = run_suite(names, args.count)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        regressions = compare(current, previous, args.threshold)
+        for name, metric, old, new, change in regressions:
+            print(f"RÉGRESSION {name} {metric}: {old:.3f} -> {new:.3f} ({change:+.1%})")
+        if regressions:
+            return 1
+        print(f"Aucune régression au-delà de {args.threshold:.0%} par rapport à {args.compare}")
+    return 2 if current["failures"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,19 +7,51 @@
 # This software is released under the MIT License.
 # https://opensource.org/licenses/MIT
 
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A5
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.units import mm
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+except ImportError:
+    # Modes sans interface (batch, validate...) sur une machine sans Tk
+    tk = None
 import os
+import io
+import zipfile
 import tempfile
 import datetime
 import shutil
 import re
 import sys
+import csv
+import json
+import time
+import argparse
+import logging
+import contextlib
+import mmap
+import struct
+import bisect
+import unicodedata
+import threading
+import queue
+import functools
+import hashlib
+import heapq
+import pickle
+import collections
+import array
+import operator
+import itertools
+
+# reportlab n'est importé qu'au moment de générer un PDF : son import prend
+# plus de la moitié du temps de lancement. Unités et format recopiés de
+# reportlab.lib.units et reportlab.lib.pagesizes (mêmes calculs, mêmes valeurs).
+inch = 72.0
+cm = inch / 2.54
+mm = cm * 0.1
+A5 = (148 * mm, 210 * mm)
+A4 = (210 * mm, 297 * mm)
+
+log = logging.getLogger("envejp")
 
 def resource_path(relative_path):
     """Obtient le chemin vers les ressources, compatible PyInstaller"""
@@ -32,143 +64,2885 @@ def resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
+class Stats:
+    """Chronomètres et compteurs par étape (découverte des polices, rendu, sauvegarde...).
+
+    Désactivé par défaut : timer() et count() ne coûtent alors presque rien.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.timers = {}
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timer(self, name):
+        """Context manager qui chronomètre l'étape name"""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._timed(name)
+
+    def add_time(self, name, seconds):
+        entry = self.timers.get(name)
+        if entry is None:
+            entry = self.timers[name] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        """Ajoute les mesures d'un autre Stats (ou de son to_dict(), ex. d'un worker)"""
+        data = other.to_dict() if isinstance(other, Stats) else other
+        for name, timer in data["timers"].items():
+            entry = self.timers.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += timer["count"]
+            entry[1] += timer["total_s"]
+            entry[2] = max(entry[2], timer["max_ms"] / 1000)
+        for name, value in data["counters"].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        return {
+            "timers": {
+                name: {
+                    "count": count,
+                    "total_s": total,
+                    "mean_ms": total / count * 1000 if count else 0.0,
+                    "max_ms": max_s * 1000,
+                }
+                for name, (count, total, max_s) in self.timers.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+STATS = Stats()
+
+FONT_NAME = "JapaneseFont"
+
+# Champs d'une adresse, dans l'ordre du formulaire
+ADDRESS_FIELDS = ("postal_code", "address1", "address2", "company", "recipient")
+
+SYSTEM_FONT_NAMES = [
+    "NotoSansJP-VariableFont_wght.ttf",
+    "NotoSansJP-Regular.ttf",
+    "NotoSansCJK-Regular.ttc",
+    "fonts-japanese-gothic.ttf"
+]
+
+SYSTEM_FONT_PATHS = [
+    "/System/Library/Fonts/",
+    "/usr/share/fonts/",
+    "C:/Windows/Fonts/",
+    os.path.expanduser("~/Library/Fonts/")
+]
+
+def cache_dir():
+    """Dossier de cache de l'application (modifiable avec ENVEJP_CACHE_DIR)"""
+    return os.environ.get("ENVEJP_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "envejp")
+
+class FontCache:
+    """Cache disque des métadonnées de polices, indexé par chemin, taille et mtime.
+
+    Évite de reconstruire un TTFont complet pour chaque fichier à chaque
+    lancement juste pour savoir s'il est utilisable.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir(), "fonts.json")
+        self.entries = {}
+        self.dirty = False
+        # TTFont déjà construits pendant ce lancement (cache froid), réutilisés à l'enregistrement
+        self.parsed = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self.entries = data.get("fonts", {})
+        except (OSError, ValueError):
+            pass
+
+    def probe(self, font_path):
+        """Retourne les métadonnées de la police, ou None si elle est inutilisable"""
+        try:
+            st = os.stat(font_path)
+        except OSError:
+            return None
+
+        key = os.path.abspath(font_path)
+        entry = self.entries.get(key)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            STATS.count("font_cache_hits")
+            return entry if entry["valid"] else None
+        STATS.count("font_cache_misses")
+
+        font_file = os.path.basename(font_path)
+        log.debug("Testing font: %s", font_path)
+        entry = {
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "name": font_file,
+            "display_name": font_file.replace('.ttf', '').replace('.ttc', ''),
+            "valid": False,
+        }
+        try:
+            from reportlab.pdfbase.ttfonts import TTFont
+            self.parsed[key] = TTFont(FONT_NAME, font_path)
+            entry["valid"] = True
+            log.debug("Successfully tested font: %s", font_file)
+        except Exception as font_error:
+            log.warning("Failed to load %s: %s", font_file, font_error)
+
+        self.entries[key] = entry
+        self.dirty = True
+        return entry if entry["valid"] else None
+
+    def digest(self, font_path):
+        """Empreinte SHA-256 du fichier de police, calculée une fois par version du fichier"""
+        entry = self.probe(font_path)
+        if entry is None:
+            raise ValueError(f"Police inutilisable: {font_path}")
+        if "sha256" not in entry:
+            sha = hashlib.sha256()
+            with open(font_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(block)
+            entry["sha256"] = sha.hexdigest()
+            self.dirty = True
+            self.save()
+        return entry["sha256"]
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.VERSION, "fonts": self.entries}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError as e:
+            log.warning("Could not write font cache %s: %s", self.path, e)
+
+_font_cache = None
+
+def get_font_cache():
+    global _font_cache
+    if _font_cache is None:
+        _font_cache = FontCache()
+    return _font_cache
+
+def list_available_fonts():
+    """Liste les polices utilisables du dossier fonts/ (via le cache de polices)"""
+    with STATS.timer("font_discovery"):
+        return _list_available_fonts()
+
+def _list_available_fonts():
+    start = time.perf_counter()
+    cache = get_font_cache()
+    font_dir = resource_path("fonts")
+
+    log.debug("Font directory: %s (exists: %s)", font_dir, os.path.exists(font_dir))
+
+    available_fonts = []
+    if os.path.exists(font_dir):
+        files_in_dir = os.listdir(font_dir)
+        log.debug("Files in fonts directory: %s", files_in_dir)
+
+        for font_file in files_in_dir:
+            if font_file.endswith(('.ttf', '.ttc')):  # Exclure .otf qui pose problème
+                font_path = os.path.join(font_dir, font_file)
+                info = cache.probe(font_path)
+                if info:
+                    available_fonts.append({
+                        'name': font_file,
+                        'path': font_path,
+                        'display_name': info['display_name']
+                    })
+
+    if len(available_fonts) == 0:
+        log.info("No valid fonts found in fonts directory")
+        # Essayer les polices spécifiques que vous avez mentionnées
+        specific_fonts = ["SawarabiMincho-Regular.ttf", "NotoSansJP-VariableFont_wght.ttf"]
+        for font_name in specific_fonts:
+            font_path = resource_path(os.path.join("fonts", font_name))
+            info = cache.probe(font_path)
+            if info:
+                available_fonts.append({
+                    'name': font_name,
+                    'path': font_path,
+                    'display_name': info['display_name']
+                })
+                log.debug("Found specific font: %s", font_name)
+
+    cache.save()
+    log.debug("Font discovery: %.1f ms", (time.perf_counter() - start) * 1000)
+    return available_fonts
+
+# Police choisie mais pas encore chargée : le TTFont n'est construit qu'au premier rendu
+_selected_font_path = None
+_registered_font_path = None
+
+def register_japanese_font(font_path):
+    """Enregistre immédiatement le fichier donné sous le nom "JapaneseFont" """
+    global _selected_font_path, _registered_font_path
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    key = os.path.abspath(font_path)
+    font = get_font_cache().parsed.pop(key, None) if _font_cache else None
+    with STATS.timer("font_registration"):
+        pdfmetrics.registerFont(font or TTFont(FONT_NAME, font_path))
+    _selected_font_path = _registered_font_path = font_path
+
+def select_japanese_font(font_path):
+    """Choisit la police "JapaneseFont" sans la charger (voir ensure_japanese_font)"""
+    global _selected_font_path
+    _selected_font_path = font_path
+    # Les autres polices testées pendant la découverte ne servent plus
+    if _font_cache:
+        key = os.path.abspath(font_path)
+        _font_cache.parsed = {k: v for k, v in _font_cache.parsed.items() if k == key}
+
+def ensure_japanese_font():
+    """Charge la police choisie si ce n'est pas déjà fait (appelé avant chaque rendu)"""
+    if _selected_font_path and _registered_font_path != _selected_font_path:
+        register_japanese_font(_selected_font_path)
+
+def preload_japanese_font():
+    """ensure_japanese_font pour un thread d'arrière-plan : une erreur est seulement
+    journalisée, elle sera signalée à la génération du PDF"""
+    try:
+        ensure_japanese_font()
+        if _selected_font_path:
+            glyph_advances(_selected_font_path)
+    except Exception as e:
+        log.warning("Could not preload font: %s", e)
+
+def find_system_font():
+    """Cherche une police japonaise dans les dossiers système.
+
+    Retourne (chemin, nom du fichier) ou (None, None).
+    """
+    log.info("Searching system fonts...")
+    cache = get_font_cache()
+    try:
+        for sys_path in SYSTEM_FONT_PATHS:
+            if os.path.exists(sys_path):
+                for font_file in SYSTEM_FONT_NAMES:
+                    full_path = os.path.join(sys_path, font_file)
+                    if os.path.exists(full_path) and cache.probe(full_path):
+                        log.info("Found system font: %s", full_path)
+                        return full_path, font_file
+    finally:
+        cache.save()
+    return None, None
+
+def setup_font_headless(font_path=None):
+    """Choisit "JapaneseFont" sans interface graphique.
+
+    Utilise font_path s'il est fourni, sinon la première police valide de
+    fonts/, sinon une police système. La police n'est chargée qu'au premier
+    rendu. Retourne le chemin choisi ou None.
+    """
+    if font_path:
+        select_japanese_font(font_path)
+        return font_path
+
+    available_fonts = list_available_fonts()
+    if available_fonts:
+        select_japanese_font(available_fonts[0]['path'])
+        return available_fonts[0]['path']
+
+    found, _ = find_system_font()
+    if found:
+        select_japanese_font(found)
+    return found
+
+def discover_fonts():
+    """Polices de fonts/ et, s'il n'y en a aucune, police système. Sans rien charger"""
+    available_fonts = list_available_fonts()
+    system_font = find_system_font() if not available_fonts else (None, None)
+    return available_fonts, system_font
+
+def config_dir():
+    """Dossier des réglages (modifiable avec ENVEJP_CONFIG_DIR)"""
+    return os.environ.get("ENVEJP_CONFIG_DIR") or os.path.join(os.path.expanduser("~"), ".config", "envejp")
+
+def load_settings():
+    """Réglages mémorisés entre deux lancements (ex. la dernière police choisie)"""
+    try:
+        with open(os.path.join(config_dir(), "settings.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_settings(settings):
+    path = os.path.join(config_dir(), "settings.json")
+    try:
+        os.makedirs(config_dir(), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(settings, f, ensure_ascii=False, indent=1)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        log.warning("Could not save settings %s: %s", path, e)
+
+def address_lines(record):
+    """Retourne les lignes verticales non vides d'une adresse"""
+    lines = []
+    for field in ADDRESS_FIELDS[1:]:
+        value = (record.get(field) or "").strip()
+        if value: lines.append(value)
+    return lines
+
+# Form XObject contenant les éléments fixes de l'enveloppe (grille du code postal...),
+# défini une fois par document et référencé depuis chaque page
+ENVELOPE_FORM = "EnvelopeFurniture"
+
+def draw_postal_grid(c, postal_x, postal_y, case_width, case_height, spacing):
+    """Dessine les 7 cases rouges du code postal et le tiret"""
+    for i in range(8):
+        current_x = postal_x + i * (case_width + spacing)
+        if i == 3:
+            c.setStrokeColorRGB(0.8, 0, 0)
+            c.setLineWidth(1.5)
+            dash_width = case_width / 5
+            dash_x_start = current_x + (case_width - dash_width) / 2
+            dash_y = postal_y + case_height / 2
+            c.line(dash_x_start, dash_y, dash_x_start + dash_width, dash_y)
+        else:
+            c.setStrokeColorRGB(0.8, 0, 0)
+            c.setLineWidth(2 if i < 3 else 1)
+            c.setFillColorRGB(1, 1, 1)
+            c.rect(current_x, postal_y, case_width, case_height, stroke=1, fill=1)
+
+def draw_vertical_line(c, x, y, text, steps, font_size):
+    """Dessine une ligne verticale dans un seul objet texte (BT/ET).
+
+    Le premier caractère est en (x, y), le caractère j+1 steps[j] plus bas que
+    le caractère j (via l'interligne du texte, changée seulement quand le pas
+    change). La coupure en bas de page est faite par layout_envelope, text ne
+    contient que les caractères visibles. font_size est la taille déjà
+    choisie avec setFont : un caractère absent de la police est pris dans
+    une police de secours (voir glyph_fonts) à cette taille.
+    """
+    if not text:
+        return
+    text_object = c.beginText(x, y)
+    leading = None
+    fonts = glyph_fonts(text)
+    if fonts is None:
+        for char, step in zip(text, steps):
+            if step != leading:
+                text_object.setLeading(step)
+                leading = step
+            text_object.textLine(char)
+    else:
+        current = FONT_NAME
+        for char, step, font in zip(text, steps, fonts):
+            if font != current:
+                # setFont remet aussi l'interligne
+                text_object.setFont(font, font_size, step)
+                current, leading = font, step
+            elif step != leading:
+                text_object.setLeading(step)
+                leading = step
+            text_object.textLine(char)
+    c.drawText(text_object)
+
+# Chasse des glyphes -------------------------------------------------------------
+#
+# Pour chaque caractère du plan multilingue de base, la chasse du glyphe en
+# millièmes d'em (tableau de 65536 uint16), ou MISSING_GLYPH si la police n'a
+# pas ce caractère. Calculée une fois par fichier de police, puis gardée dans
+# cache_dir()/advances/<sha256 de la police>.v<version>.bin : la mise en
+# page n'a pas besoin de charger la police.
+
+ADVANCE_TABLE_SIZE = 0x10000
+ADVANCE_TABLE_VERSION = 2
+MISSING_GLYPH = 0xFFFF
+
+_advance_tables = {}
+
+def build_advance_table(font_path):
+    """Lit la chasse de chaque caractère dans la police (lent : analyse le fichier)"""
+    key = os.path.abspath(font_path)
+    if _registered_font_path and os.path.abspath(_registered_font_path) == key:
+        from reportlab.pdfbase import pdfmetrics
+        font = pdfmetrics.getFont(FONT_NAME)
+    else:
+        font = get_font_cache().parsed.get(key) if _font_cache else None
+        if font is None:
+            from reportlab.pdfbase.ttfonts import TTFont
+            font = TTFont(FONT_NAME, font_path)
+    table = array.array("H", [MISSING_GLYPH]) * ADVANCE_TABLE_SIZE
+    for code, width in font.face.charWidths.items():
+        if code < ADVANCE_TABLE_SIZE:
+            table[code] = min(int(round(width)), MISSING_GLYPH - 1)
+    return table
+
+def glyph_advances(font_path):
+    """Table des chasses de la police (voir build_advance_table), via le cache disque"""
+    key = os.path.abspath(font_path)
+    table = _advance_tables.get(key)
+    if table is not None:
+        return table
+
+    path = os.path.join(cache_dir(), "advances",
+                        f"{get_font_cache().digest(font_path)}.v{ADVANCE_TABLE_VERSION}.bin")
+    table = array.array("H")
+    try:
+        with open(path, "rb") as f:
+            table.frombytes(f.read())
+    except (OSError, ValueError):
+        pass
+    if len(table) != ADVANCE_TABLE_SIZE:
+        with STATS.timer("advance_table"):
+            table = build_advance_table(font_path)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                table.tofile(f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("Could not write advance table %s: %s", path, e)
+    _advance_tables[key] = table
+    return table
+
+def fallback_advances():
+    """Chasses approchées sans police : demi-chasse pour les caractères étroits (latin, ｶﾅ)"""
+    table = _advance_tables.get(None)
+    if table is None:
+        table = array.array("H", (500 if unicodedata.east_asian_width(chr(code)) in ("Na", "H") else 1000
+                                  for code in range(ADVANCE_TABLE_SIZE)))
+        _advance_tables[None] = table
+    return table
+
+def has_advances(font_path):
+    """True si la table de la police est déjà en mémoire (la mise en page ne chargera rien)"""
+    return bool(font_path) and os.path.abspath(font_path) in _advance_tables
+
+def current_advances():
+    """Table des chasses de la police choisie, ou approchée s'il n'y en a pas"""
+    return glyph_advances(_selected_font_path) if _selected_font_path else fallback_advances()
+
+def has_glyph(advances, char):
+    code = ord(char)
+    return code >= len(advances) or advances[code] != MISSING_GLYPH
+
+# Couverture des glyphes et polices de secours -----------------------------------
+#
+# L'ensemble des caractères de chaque police (sa table cmap, tout Unicode) est
+# lu une fois, puis gardé dans cache_dir()/coverage/<sha256 de la police>.v1.bin
+# (codes triés, uint32). Un caractère absent de "JapaneseFont" est dessiné avec
+# la première police de la chaîne de secours qui l'a : fallback_fonts de
+# settings.json ou --fallback-font, sinon les polices FALLBACK_FONT_NAMES
+# trouvées dans SYSTEM_FONT_PATHS.
+
+COVERAGE_VERSION = 1
+FALLBACK_FONT_NAMES = SYSTEM_FONT_NAMES + [
+    "NotoSerifCJK-Regular.ttc",
+    "ipaexm.ttf",
+    "ipaexg.ttf",
+    "ipam.ttf",
+    "ipag.ttf",
+    "msmincho.ttc",
+    "msgothic.ttc",
+]
+
+_coverages = {}
+# Chaîne de secours (chemins), cherchée au premier caractère manquant
+_fallback_fonts = None
+# Polices de secours déjà enregistrées : nom reportlab -> chemin
+_registered_fallbacks = {}
+
+def build_coverage(font_path):
+    """Codes des caractères de la police, triés (lent : analyse le fichier)"""
+    key = os.path.abspath(font_path)
+    font = get_font_cache().parsed.get(key) if _font_cache else None
+    if font is None:
+        from reportlab.pdfbase.ttfonts import TTFont
+        font = TTFont(FONT_NAME, font_path)
+    return sorted(font.face.charToGlyph)
+
+def glyph_coverage(font_path):
+    """frozenset des caractères de la police (voir build_coverage), via le cache disque"""
+    key = os.path.abspath(font_path)
+    coverage = _coverages.get(key)
+    if coverage is not None:
+        return coverage
+
+    path = os.path.join(cache_dir(), "coverage",
+                        f"{get_font_cache().digest(font_path)}.v{COVERAGE_VERSION}.bin")
+    codes = array.array("I")
+    try:
+        with open(path, "rb") as f:
+            codes.frombytes(f.read())
+    except (OSError, ValueError):
+        codes = array.array("I")
+    if not codes:
+        with STATS.timer("coverage"):
+            codes = array.array("I", build_coverage(font_path))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                codes.tofile(f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("Could not write glyph coverage %s: %s", path, e)
+    coverage = _coverages[key] = frozenset(map(chr, codes))
+    return coverage
+
+def find_fallback_fonts():
+    """Polices FALLBACK_FONT_NAMES présentes dans les dossiers système (et leurs sous-dossiers)"""
+    found = {}
+    for sys_path in SYSTEM_FONT_PATHS:
+        for directory, _, files in os.walk(sys_path):
+            for font_file in files:
+                if font_file in FALLBACK_FONT_NAMES and font_file not in found:
+                    found[font_file] = os.path.join(directory, font_file)
+    return [found[name] for name in FALLBACK_FONT_NAMES if name in found]
+
+def set_fallback_fonts(paths):
+    """Fixe la chaîne de secours ; les polices inutilisables sont écartées"""
+    global _fallback_fonts
+    cache = get_font_cache()
+    chain = []
+    for path in paths:
+        if cache.probe(path):
+            chain.append(path)
+        else:
+            log.warning("Fallback font ignored: %s", path)
+    cache.save()
+    _fallback_fonts = chain
+    _fallback_font_name.cache_clear()
+    return chain
+
+def fallback_fonts():
+    """Chaîne des polices de secours (chemins), dans l'ordre où elles sont essayées"""
+    if _fallback_fonts is None:
+        configured = load_settings().get("fallback_fonts")
+        with STATS.timer("fallback_discovery"):
+            set_fallback_fonts(configured if configured is not None else find_fallback_fonts())
+    return _fallback_fonts
+
+def register_fallback_font(index):
+    """Enregistre la police de secours n° index sous "JapaneseFont<index + 1>" si besoin"""
+    name = f"{FONT_NAME}{index + 1}"
+    path = fallback_fonts()[index]
+    if _registered_fallbacks.get(name) != path:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        # Le TTFont gardé par probe s'appelle "JapaneseFont" : il est reconstruit sous son nom
+        if _font_cache:
+            _font_cache.parsed.pop(os.path.abspath(path), None)
+        with STATS.timer("font_registration"):
+            pdfmetrics.registerFont(TTFont(name, path))
+        _registered_fallbacks[name] = path
+    return name
+
+@functools.lru_cache(maxsize=4096)
+def _fallback_font_name(char):
+    """Nom reportlab de la première police de secours qui a char, ou None"""
+    for index, path in enumerate(fallback_fonts()):
+        if char in glyph_coverage(path):
+            return register_fallback_font(index)
+    return None
+
+def glyph_fonts(text):
+    """Police de chaque caractère de text, ou None si "JapaneseFont" les a tous.
+
+    Un caractère qu'aucune police n'a reste en "JapaneseFont" (case vide).
+    """
+    if not _selected_font_path:
+        return None
+    primary = glyph_coverage(_selected_font_path)
+    if primary.issuperset(text):
+        return None
+    fonts = []
+    for char in text:
+        if char in primary:
+            fonts.append(FONT_NAME)
+            continue
+        name = _fallback_font_name(char)
+        STATS.count("glyphs_fallback" if name else "glyphs_missing")
+        fonts.append(name or FONT_NAME)
+    return fonts
+
+def coverage_report(records, advances=None):
+    """Vérifie avant le rendu que chaque caractère dessiné a un glyphe.
+
+    Les adresses sont normalisées comme pour la mise en page (seuls les
+    caractères réellement dessinés comptent). Retourne un dict : nombre de
+    caractères distincts, caractères pris dans chaque police de secours
+    (chemin -> liste), caractères qu'aucune police n'a (missing).
+    """
+    if advances is None:
+        advances = current_advances()
+    chars = set()
+    for record in records:
+        record = normalize_record(record, advances)
+        chars.update(record["postal_code"])
+        for line in address_lines(record):
+            chars.update(line)
+    report = {"characters": len(chars), "fallback": {}, "missing": []}
+    if not _selected_font_path:
+        return report
+    uncovered = sorted(chars - glyph_coverage(_selected_font_path))
+    if uncovered:
+        chain = fallback_fonts()
+        for char in uncovered:
+            path = next((path for path in chain if char in glyph_coverage(path)), None)
+            if path:
+                report["fallback"].setdefault(path, []).append(char)
+            else:
+                report["missing"].append(char)
+    return report
+
+def describe_coverage(report):
+    """Résumé d'une ligne de coverage_report"""
+    parts = [f"{report['characters']} caractères distincts"]
+    for path, chars in report["fallback"].items():
+        parts.append(f"{len(chars)} via {os.path.basename(path)} ({''.join(chars[:20])})")
+    if report["missing"]:
+        parts.append(f"{len(report['missing'])} sans glyphe ({''.join(report['missing'][:20])})")
+    return ", ".join(parts)
+
+# Normalisation pour l'écriture verticale ---------------------------------------
+#
+# Appliquée à chaque adresse avant la mise en page : tirets et ー deviennent
+# des traits verticaux, les chiffres du numéro (番地) des adresses passent en
+# chiffres kanji, les katakana demi-chasse et le latin passent en pleine
+# chasse pour être dessinés debout. Les tables de str.translate sont
+# calculées une fois par police : un caractère n'est remplacé que si la police
+# a le glyphe de remplacement.
+
+VERTICAL_BAR = "│"
+# ー, tirets et signes moins (demi et pleine chasse)
+DASHES = "ーｰ-‐‑‒–—―−－─"
+KANJI_DIGITS = "〇一二三四五六七八九"
+# Chiffres pleine chasse ramenés en ASCII avant la conversion en kanji
+ASCII_DIGITS = str.maketrans({chr(0xFF10 + d): str(d) for d in range(10)})
+FULLWIDTH_DIGIT = re.compile("[０-９]")
+# Marques de sonorisation seules (après une lettre qui ne se combine pas)
+SPACING_MARKS = str.maketrans({"\u3099": "゛", "\u309a": "゜"})
+DIGIT_RUN = re.compile(r"[0-9]+")
+NON_DIGIT = re.compile(r"[^0-9]+")
+
+_vertical_tables = {}
+
+def vertical_tables(advances):
+    """Tables de normalisation pour la police de advances (voir has_glyph)"""
+    entry = _vertical_tables.get(id(advances))
+    if entry is not None and entry[0] is advances:
+        return entry[1]
+
+    table = {}
+    # Latin et chiffres pleine chasse (l'espace reste tel quel)
+    for code in range(0x21, 0x7F):
+        full = chr(code + 0xFEE0)
+        if has_glyph(advances, full):
+            table[code] = full
+    # Katakana demi-chasse : ｶﾞ -> カ + U+3099, recomposé en ガ par NFC
+    for code in range(0xFF66, 0xFF9E):
+        full = unicodedata.normalize("NFKC", chr(code))
+        if has_glyph(advances, full):
+            table[code] = full
+    table[0xFF9E] = "\u3099"
+    table[0xFF9F] = "\u309a"
+    if has_glyph(advances, VERTICAL_BAR):
+        for dash in DASHES:
+            table[ord(dash)] = VERTICAL_BAR
+
+    tables = {
+        "vertical": str.maketrans(table),
+        # translate est lent sur du texte non ASCII : on ne l'appelle que si la ligne a
+        # un caractère à remplacer, ce que cette classe repère bien plus vite
+        "replaced": re.compile("[%s]" % re.escape("".join(map(chr, table)))),
+        "zero": has_glyph(advances, KANJI_DIGITS[0]),
+    }
+    _vertical_tables[id(advances)] = (advances, tables)
+    return tables
+
+def kanji_number(digits, zero=True):
+    """"11" -> "十一", "20" -> "二十" ; à partir de 3 chiffres, chiffre par chiffre ("101" -> "一〇一").
+
+    Sans 〇 dans la police (zero=False), un nombre qui en aurait besoin reste en chiffres arabes.
+    """
+    if len(digits) <= 2 and not (len(digits) == 2 and digits[0] == "0"):
+        tens, ones = divmod(int(digits), 10)
+        if tens == 0 and ones == 0:
+            return KANJI_DIGITS[0] if zero else digits
+        return ((KANJI_DIGITS[tens] if tens > 1 else "") + ("十" if tens else "") +
+                (KANJI_DIGITS[ones] if ones else ""))
+    if "0" in digits and not zero:
+        return digits
+    return "".join(KANJI_DIGITS[int(d)] for d in digits)
+
+def normalize_line(text, tables, numerals=False):
+    """Une ligne d'adresse pour l'écriture verticale (numerals : chiffres en kanji)"""
+    if numerals:
+        if FULLWIDTH_DIGIT.search(text):
+            text = text.translate(ASCII_DIGITS)
+        if DIGIT_RUN.search(text):
+            zero = tables["zero"]
+            text = DIGIT_RUN.sub(lambda m: kanji_number(m.group(), zero), text)
+    if tables["replaced"].search(text):
+        text = text.translate(tables["vertical"])
+    if "\u3099" in text or "\u309a" in text:
+        text = unicodedata.normalize("NFC", text).translate(SPACING_MARKS)
+    return text
+
+def postal_digits(postal_code):
+    """Les chiffres du code postal, quelle que soit leur écriture ("〒160ｰ0007" -> "1600007")"""
+    return NON_DIGIT.sub("", (postal_code or "").translate(ASCII_DIGITS))
+
+def normalize_record(record, advances=None):
+    """Copie de record prête pour la mise en page verticale (voir normalize_line).
+
+    Les chiffres kanji ne concernent que les lignes d'adresse ; postal_code
+    ne garde que ses chiffres.
+    """
+    tables = vertical_tables(current_advances() if advances is None else advances)
+    return {
+        "postal_code": postal_digits(record.get("postal_code")),
+        "address1": normalize_line((record.get("address1") or "").strip(), tables, numerals=True),
+        "address2": normalize_line((record.get("address2") or "").strip(), tables, numerals=True),
+        "company": normalize_line((record.get("company") or "").strip(), tables),
+        "recipient": normalize_line((record.get("recipient") or "").strip(), tables),
+    }
+
+def normalize_records(records, advances=None):
+    """normalize_record sur toute une liste d'adresses, avec les mêmes tables"""
+    advances = current_advances() if advances is None else advances
+    with STATS.timer("normalize"):
+        return [normalize_record(record, advances) for record in records]
+
+# Index binaire des codes postaux (KEN_ALL de Japan Post) ------------------------
+#
+# En-tête : magic, nombre d'entrées, position du tableau des chaînes.
+# Puis la colonne des codes (uint32, triés), puis pour chaque code les
+# positions (préfecture, ville, quartier) dans le tableau des chaînes
+# (UTF-8 préfixé par sa longueur). La recherche est une dichotomie dans la
+# colonne des codes, lue directement dans le fichier mappé en mémoire.
+
+POSTAL_INDEX_MAGIC = b"EJPZIP02"
+POSTAL_INDEX_HEADER = struct.Struct("<8sII")
+POSTAL_INDEX_ENTRY = struct.Struct("<III")
+POSTAL_INDEX_STRING_LENGTH = struct.Struct("<H")
+
+WHITESPACE = re.compile(r"\s+")
+
+# Mentions de KEN_ALL qui ne font pas partie du nom du quartier. « <commune>一円 »
+# (toute la commune a le même code) est traité à part dans _read_ken_all : un
+# vrai quartier peut finir par 一円 (多賀町一円).
+TOWN_NOISE = re.compile(r"以下に掲載がない場合|の次に番地がくる場合|（.*）?$")
+TOWN_WHOLE_CITY = "一円"
+
+def postal_index_path():
+    """Emplacement par défaut de l'index des codes postaux"""
+    return os.path.join(cache_dir(), "postal.idx")
+
+def postal_code_number(postal_code):
+    """'〒160ｰ0007' -> 1600007, ou None si ce n'est pas un code à 7 chiffres"""
+    digits = "".join(ch for ch in unicodedata.normalize("NFKC", postal_code or "") if ch.isdigit())
+    return int(digits) if len(digits) == 7 else None
+
+def _read_ken_all(csv_path, encoding):
+    """Lit KEN_ALL.CSV : (code, préfecture, ville, quartier), quartiers sur plusieurs lignes fusionnés"""
+    with open(csv_path, newline="", encoding=encoding) as f:
+        pending = None
+        for row in csv.reader(f):
+            if len(row) < 9:
+                continue
+            code, prefecture, city, town = row[2], row[6], row[7], row[8]
+            if pending:
+                # Un quartier trop long est coupé sur les lignes suivantes jusqu'à la parenthèse fermante
+                pending[3] += town
+                if "）" not in town:
+                    continue
+                code, prefecture, city, town = pending
+                pending = None
+            elif "（" in town and "）" not in town:
+                pending = [code, prefecture, city, town]
+                continue
+            # 西多摩郡檜原村 / 檜原村一円 : le nom de la commune suivi de 一円
+            name = town[:-len(TOWN_WHOLE_CITY)]
+            if town.endswith(TOWN_WHOLE_CITY) and name and city.endswith(name):
+                town = ""
+            yield int(code), prefecture, city, TOWN_NOISE.sub("", town)
+
+def build_postal_index(csv_path, index_path=None, encoding="cp932"):
+    """Compile KEN_ALL.CSV en index binaire trié. Retourne (chemin, nombre d'entrées)"""
+    index_path = index_path or postal_index_path()
+    rows = sorted(set(_read_ken_all(csv_path, encoding)))
+
+    strings = {}
+    pool = bytearray()
+    def intern(text):
+        offset = strings.get(text)
+        if offset is None:
+            data = text.encode("utf-8")
+            offset = strings[text] = len(pool)
+            pool.extend(POSTAL_INDEX_STRING_LENGTH.pack(len(data)))
+            pool.extend(data)
+        return offset
+
+    codes = struct.pack(f"<{len(rows)}I", *(row[0] for row in rows))
+    entries = bytearray()
+    for code, prefecture, city, town in rows:
+        entries.extend(POSTAL_INDEX_ENTRY.pack(intern(prefecture), intern(city), intern(town)))
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(POSTAL_INDEX_HEADER.pack(POSTAL_INDEX_MAGIC, len(rows),
+                                         POSTAL_INDEX_HEADER.size + len(codes) + len(entries)))
+        f.write(codes)
+        f.write(entries)
+        f.write(pool)
+    os.replace(tmp_path, index_path)
+    return index_path, len(rows)
+
+class PostalIndex:
+    """Index des codes postaux mappé en mémoire : recherche en O(log n) sans tout charger"""
+
+    def __init__(self, index_path=None):
+        self.path = index_path or postal_index_path()
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, self._strings = POSTAL_INDEX_HEADER.unpack_from(self._mm, 0)
+        if magic != POSTAL_INDEX_MAGIC:
+            self._mm.close()
+            raise ValueError(f"{self.path} n'est pas un index de codes postaux")
+        # Vue sur la colonne des codes : bisect y fait la dichotomie sans copie
+        # (cast natif, l'index est écrit en petit-boutiste comme les machines visées)
+        codes_end = POSTAL_INDEX_HEADER.size + 4 * self.size
+        self._codes = memoryview(self._mm)[POSTAL_INDEX_HEADER.size:codes_end].cast("I")
+        self._entries = codes_end
+
+    def close(self):
+        self._codes.release()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def _string(self, offset):
+        position = self._strings + offset
+        (length,) = POSTAL_INDEX_STRING_LENGTH.unpack_from(self._mm, position)
+        position += POSTAL_INDEX_STRING_LENGTH.size
+        return self._mm[position:position + length].decode("utf-8")
+
+    def lookup(self, postal_code):
+        """Retourne la liste des (préfecture, ville, quartier) du code postal"""
+        code = postal_code if isinstance(postal_code, int) else postal_code_number(postal_code)
+        if code is None:
+            return []
+        results = []
+        i = bisect.bisect_left(self._codes, code)
+        while i < self.size and self._codes[i] == code:
+            prefecture, city, town = POSTAL_INDEX_ENTRY.unpack_from(
+                self._mm, self._entries + i * POSTAL_INDEX_ENTRY.size)
+            results.append((self._string(prefecture), self._string(city), self._string(town)))
+            i += 1
+        return results
+
+_postal_index = None
+
+def get_postal_index():
+    """Index par défaut, ouvert à la première utilisation ; None s'il n'a pas été construit"""
+    global _postal_index
+    if _postal_index is None and os.path.exists(postal_index_path()):
+        try:
+            _postal_index = PostalIndex()
+        except (OSError, ValueError) as e:
+            log.warning("Could not open postal index: %s", e)
+    return _postal_index
+
+def check_postal_address(index, postal_code, address1):
+    """Vérifie que le code postal correspond à l'adresse ligne 1.
+
+    Retourne un message d'avertissement, ou None si tout concorde.
+    """
+    code = postal_code_number(postal_code)
+    if code is None:
+        return "Le code postal doit avoir 7 chiffres"
+    candidates = index.lookup(code)
+    if not candidates:
+        return f"Code postal {code:07d} inconnu de Japan Post"
+    address = WHITESPACE.sub("", address1 or "")
+    for prefecture, city, town in candidates:
+        # La préfecture est souvent omise, la ville et le quartier doivent y être
+        if city in address and town in address:
+            return None
+    prefecture, city, town = candidates[0]
+    return (f"Le code postal {code // 10000:03d}-{code % 10000:04d} correspond à "
+            f"{prefecture}{city}{town}, pas à l'adresse ligne 1")
+
+def validate_address(record, postal_index=None):
+    """Vérifie une adresse. Retourne (erreurs, avertissements), deux listes de messages.
+
+    Avec postal_index (voir PostalIndex), vérifie aussi que le code postal
+    correspond à l'adresse ligne 1. Mêmes règles que validate_records.
+    """
+    postal, addr1, addr2, company, recipient = [(record.get(field) or "").strip() for field in ADDRESS_FIELDS]
+    errors, warnings = address_messages(postal, addr1, addr2, company, recipient)
+    if postal_index is not None and postal and addr1:
+        mismatch = check_postal_address(postal_index, postal, addr1)
+        if mismatch:
+            warnings.append(mismatch)
+    return errors, warnings
+
+# Longueurs au-delà desquelles une adresse est signalée
+ADDRESS1_MAX_LENGTH = 40
+LINE_MAX_LENGTH = 35
+
+def address_messages(postal, addr1, addr2, company, recipient):
+    """Règles de validation pour une adresse (champs déjà nettoyés), sans l'index postal"""
+    errors = []
+    warnings = []
+
+    # Vérifications
+    if not postal:
+        errors.append("Le code postal est obligatoire")
+    elif not postal.startswith('〒'):
+        warnings.append("Le code postal devrait commencer par 〒")
+
+    if not addr1:
+        errors.append("L'adresse ligne 1 est obligatoire")
+    elif len(addr1) > ADDRESS1_MAX_LENGTH:
+        warnings.append(f"Adresse ligne 1 très longue ({len(addr1)} caractères)")
+
+    if not company:
+        errors.append("Le nom de l'entreprise est obligatoire")
+
+    if not recipient:
+        errors.append("Le destinataire est obligatoire")
+
+    # Vérifier la longueur totale pour chaque ligne
+    lines = [addr1, addr2, company, recipient]
+    for i, line in enumerate(lines, 1):
+        if len(line) > LINE_MAX_LENGTH:
+            warnings.append(f"Ligne {i} risque de déborder ({len(line)} caractères)")
+
+    return errors, warnings
+
+def validate_records(records, postal_index=None, chunk_size=10000):
+    """Vérifie des adresses par paquets de chunk_size.
+
+    Produit (position, adresse, erreurs, avertissements) pour chaque adresse
+    qui a au moins un message (position à partir de 0 dans records),
+    avec les règles de address_messages et, si postal_index est donné, la
+    concordance code postal / adresse ligne 1.
+    """
+    chunk = []
+    offset = 0
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield from _validate_chunk(chunk, postal_index, offset)
+            offset += len(chunk)
+            chunk = []
+    if chunk:
+        yield from _validate_chunk(chunk, postal_index, offset)
+
+_field_getters = [operator.itemgetter(field) for field in ADDRESS_FIELDS]
+
+def _validate_chunk(chunk, postal_index, offset):
+    """Un paquet de validate_records, traité colonne par colonne.
+
+    Les champs sont nettoyés et mesurés une colonne à la fois (map sur des
+    fonctions intégrées, sans boucle Python par adresse). Chaque règle est
+    d'abord testée sur toute la colonne (min, max, all) : ce n'est que si
+    elle échoue quelque part que les adresses concernées sont cherchées, et
+    address_messages n'est appelé que pour celles-là.
+    """
+    with STATS.timer("validate"):
+        try:
+            # Cas courant (read_recipients, formulaire) : tous les champs sont des chaînes
+            columns = [list(map(str.strip, map(getter, chunk))) for getter in _field_getters]
+        except (KeyError, TypeError):
+            columns = [[(record.get(field) or "").strip() for record in chunk] for field in ADDRESS_FIELDS]
+        postal, addr1, addr2, company, recipient = columns
+        postal_len, addr1_len, addr2_len, company_len, recipient_len = [list(map(len, column)) for column in columns]
+        positions = range(len(chunk))
+
+        flagged = set()
+        # ADDRESS1_MAX_LENGTH >= LINE_MAX_LENGTH : une adresse sans ligne trop longue n'a aucun
+        # avertissement de longueur
+        for lengths in (addr1_len, addr2_len, company_len, recipient_len):
+            if max(lengths) > LINE_MAX_LENGTH:
+                flagged.update(itertools.compress(positions, map(LINE_MAX_LENGTH.__lt__, lengths)))
+        for lengths in (postal_len, addr1_len, company_len, recipient_len):
+            if not min(lengths):
+                flagged.update(itertools.compress(positions, map(operator.not_, lengths)))
+        marked = list(map(str.startswith, postal, itertools.repeat('〒')))
+        if not all(marked):
+            flagged.update(itertools.compress(positions, map(operator.not_, marked)))
+
+        if len(flagged) < len(chunk) // 2:
+            results = {i: address_messages(postal[i], addr1[i], addr2[i], company[i], recipient[i])
+                       for i in flagged}
+        else:
+            # Fichier où presque tout est signalé : autant tout passer dans address_messages
+            results = {i: messages for i, messages in enumerate(map(address_messages, *columns))
+                       if messages[0] or messages[1]}
+
+        if postal_index is not None:
+            for i, (code, address) in enumerate(zip(postal, addr1)):
+                if code and address:
+                    mismatch = check_postal_address(postal_index, code, address)
+                    if mismatch:
+                        results.setdefault(i, ([], []))[1].append(mismatch)
+
+    STATS.count("validated", len(chunk))
+    return [(offset + i, chunk[i], errors, warnings) for i, (errors, warnings) in sorted(results.items())]
+
+def write_validation_report(path, issues, fmt=None):
+    """Écrit les résultats de validate_records dans un rapport CSV ou JSON.
+
+    Une ligne par adresse signalée : son numéro (à partir de 1), son état
+    ("erreur" ou "avertissement"), ses champs et ses messages. Le format est
+    déduit de l'extension si fmt n'est pas donné. Retourne (adresses en
+    erreur, adresses avec seulement des avertissements).
+    """
+    if fmt is None:
+        fmt = "json" if path.lower().endswith(".json") else "csv"
+    invalid = warned = 0
+    rows = []
+    for position, record, errors, warnings in issues:
+        if errors:
+            invalid += 1
+        else:
+            warned += 1
+        rows.append({
+            "row": position + 1,
+            "status": "erreur" if errors else "avertissement",
+            **{field: record.get(field) or "" for field in ADDRESS_FIELDS},
+            "errors": errors,
+            "warnings": warnings,
+        })
+
+    # utf-8-sig : le rapport CSV s'ouvre directement dans Excel
+    with open(path, "w", newline="", encoding="utf-8-sig" if fmt == "csv" else "utf-8") as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, ["row", "status", *ADDRESS_FIELDS, "errors", "warnings"])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({**row, "errors": " / ".join(row["errors"]),
+                                 "warnings": " / ".join(row["warnings"])})
+        elif fmt == "json":
+            json.dump({"invalid": invalid, "warnings": warned, "rows": rows}, f, ensure_ascii=False, indent=1)
+        else:
+            raise ValueError(f"Format inconnu: {fmt}")
+    return invalid, warned
+
+# Tailles essayées par layout_envelope, de la plus grande à la plus petite : (font_size, char_spacing)
+FIT_SIZES = ((14, 20), (12, 18), (10, 15), (9, 13), (8, 11))
+
+# Part de la largeur inutilisée d'un caractère étroit (latin, demi-chasse)
+# reprise en hauteur : un chiffre debout est plus haut que large
+NARROW_SQUEEZE = 0.5
+
+# Formats d'enveloppe --------------------------------------------------------------
+#
+# Chaque format est décrit en mm (ENVELOPE_TEMPLATES, ou un fichier JSON du même
+# modèle, voir load_templates). Les coordonnées en points en sont calculées une
+# seule fois dans un EnvelopeGeometry, partagé par toutes les pages d'un rendu.
+#
+#   size            largeur et hauteur de l'enveloppe
+#   postal_top      haut des cases du code postal, depuis le haut de l'enveloppe
+#   postal_right    bord droit de la dernière case, depuis le bord droit
+#   postal_case     largeur, hauteur et écart des cases
+#   text_right      première colonne de texte, depuis le bord droit
+#   text_top        premier caractère, depuis le haut
+#   line_spacing    écart entre deux colonnes
+#   indent          retrait de chaque ligne par rapport à la précédente
+#   margin_bottom   le texte s'arrête au-dessus de cette marge
+#   margin_left     pas de colonne à gauche de cette marge
+#   fit_sizes       tailles essayées (font_size, char_spacing), de la plus grande à la plus petite
+
+ENVELOPE_TEMPLATES = {
+    "a5": {
+        "label": "A5 (148 × 210 mm)", "size": (148, 210),
+        "postal_top": 15, "postal_right": 20.5, "postal_case": (8, 10, 1),
+        "text_right": 40, "text_top": 34, "line_spacing": 12, "indent": 6,
+        "margin_bottom": 10, "margin_left": 10, "fit_sizes": FIT_SIZES,
+    },
+    # Cases du code postal à l'emplacement normalisé par la poste japonaise
+    "chokei3": {
+        "label": "長形3号 (120 × 235 mm)", "size": (120, 235),
+        "postal_top": 12, "postal_right": 8, "postal_case": (5.7, 8, 1.3),
+        "text_right": 25, "text_top": 30, "line_spacing": 12, "indent": 6,
+        "margin_bottom": 10, "margin_left": 10, "fit_sizes": FIT_SIZES,
+    },
+    "chokei4": {
+        "label": "長形4号 (90 × 205 mm)", "size": (90, 205),
+        "postal_top": 12, "postal_right": 8, "postal_case": (5.7, 8, 1.3),
+        "text_right": 20, "text_top": 30, "line_spacing": 10, "indent": 5,
+        "margin_bottom": 10, "margin_left": 8, "fit_sizes": ((12, 18), (10, 15), (9, 13), (8, 11)),
+    },
+    "kakugata2": {
+        "label": "角形2号 (240 × 332 mm)", "size": (240, 332),
+        "postal_top": 12, "postal_right": 8, "postal_case": (5.7, 8, 1.3),
+        "text_right": 45, "text_top": 35, "line_spacing": 16, "indent": 8,
+        "margin_bottom": 15, "margin_left": 15,
+        "fit_sizes": ((20, 28), (18, 25), (16, 22), (14, 20), (12, 18)),
+    },
+}
+DEFAULT_TEMPLATE = "a5"
+
+class EnvelopeGeometry:
+    """Coordonnées fixes d'un format d'enveloppe, en points PDF, calculées une seule fois.
+
+    Immuable : une même instance sert à toutes les pages, et aux workers.
+    """
+
+    __slots__ = ("name", "label", "spec", "page_size", "page_width", "page_height",
+                 "postal_x", "postal_y", "case_width", "case_height", "spacing", "digit_x", "digit_y",
+                 "x_start", "y_start", "line_spacing", "indent_offset", "margin_bottom", "margin_left",
+                 "fit_sizes", "form_name")
+
+    def __init__(self, name, spec):
+        try:
+            page_width, page_height = (value * mm for value in spec["size"])
+            case_width, case_height, spacing = (value * mm for value in spec["postal_case"])
+            postal_x = page_width - spec["postal_right"] * mm - (8 * case_width + 7 * spacing)
+            postal_y = page_height - spec["postal_top"] * mm - case_height
+            values = {
+                "name": name,
+                "label": spec.get("label", name),
+                "spec": json.dumps(spec, sort_keys=True, ensure_ascii=False),
+                "page_size": (page_width, page_height),
+                "page_width": page_width,
+                "page_height": page_height,
+                "postal_x": postal_x,
+                "postal_y": postal_y,
+                "case_width": case_width,
+                "case_height": case_height,
+                "spacing": spacing,
+                # Bord gauche de la case de chaque chiffre (la 4e case est le tiret)
+                "digit_x": tuple(postal_x + i * (case_width + spacing) for i in range(8) if i != 3),
+                "digit_y": postal_y + 2 * mm,
+                "x_start": page_width - spec["text_right"] * mm,
+                "y_start": page_height - spec["text_top"] * mm,
+                "line_spacing": spec["line_spacing"] * mm,
+                "indent_offset": spec["indent"] * mm,
+                "margin_bottom": spec["margin_bottom"] * mm,
+                "margin_left": spec["margin_left"] * mm,
+                "fit_sizes": tuple((size, step) for size, step in spec.get("fit_sizes", FIT_SIZES)),
+                "form_name": f"{ENVELOPE_FORM}_{name}",
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Format d'enveloppe {name} invalide: {e!r}")
+        if not values["fit_sizes"]:
+            raise ValueError(f"Format d'enveloppe {name} invalide: fit_sizes vide")
+        for slot, value in values.items():
+            object.__setattr__(self, slot, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} est immuable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} est immuable")
+
+    def __reduce__(self):
+        # Pour les workers : recalculé à partir de la description
+        return EnvelopeGeometry, (self.name, json.loads(self.spec))
+
+    def __repr__(self):
+        return f"EnvelopeGeometry({self.name!r}, {self.label!r})"
+
+def templates_path():
+    return os.path.join(config_dir(), "templates.json")
+
+def load_templates(path):
+    """Ajoute les formats d'un fichier JSON {nom: description} à ENVELOPE_TEMPLATES.
+
+    Une description peut partir d'un format existant avec "base" et n'en
+    changer que quelques valeurs. Retourne les noms ajoutés.
+    """
+    with open(path, encoding="utf-8") as f:
+        templates = json.load(f)
+    if not isinstance(templates, dict):
+        raise ValueError(f"{path}: objet JSON {{nom: format}} attendu")
+    for name, spec in templates.items():
+        if not isinstance(spec, dict):
+            raise ValueError(f"{path}: format {name} invalide")
+        spec = dict(spec)
+        base = spec.pop("base", None)
+        if base is not None:
+            if base not in ENVELOPE_TEMPLATES:
+                raise ValueError(f"{path}: format de base inconnu pour {name}: {base}")
+            spec = {**ENVELOPE_TEMPLATES[base], "label": name, **spec}
+        # Vérifié tout de suite : une erreur du fichier est signalée au chargement
+        try:
+            EnvelopeGeometry(name, spec)
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}")
+        ENVELOPE_TEMPLATES[name] = spec
+        _geometries.pop(name, None)
+    return list(templates)
+
+_geometries = {}
+_user_templates_loaded = False
+_selected_template = DEFAULT_TEMPLATE
+
+def envelope_templates():
+    """Formats disponibles : ceux de ENVELOPE_TEMPLATES et de templates_path() s'il existe"""
+    global _user_templates_loaded
+    if not _user_templates_loaded:
+        _user_templates_loaded = True
+        if os.path.exists(templates_path()):
+            try:
+                load_templates(templates_path())
+            except (OSError, ValueError) as e:
+                log.warning("Could not load templates %s: %s", templates_path(), e)
+    return ENVELOPE_TEMPLATES
+
+def get_geometry(name=None):
+    """EnvelopeGeometry d'un format (par défaut celui choisi), calculé à la première demande"""
+    name = name or _selected_template
+    geometry = _geometries.get(name)
+    if geometry is None:
+        templates = envelope_templates()
+        if name not in templates:
+            raise ValueError(f"Format d'enveloppe inconnu: {name} (formats: {', '.join(templates)})")
+        geometry = _geometries[name] = EnvelopeGeometry(name, templates[name])
+    return geometry
+
+def select_template(name):
+    """Choisit le format utilisé par défaut par layout_envelope et les rendus"""
+    global _selected_template
+    get_geometry(name)
+    _selected_template = name
+
+def install_geometry(geometry):
+    """Choisit un format déjà calculé, sans le chercher dans les formats connus.
+
+    Pour les workers : un format chargé avec --templates n'existe que dans
+    le processus principal (avec spawn, le worker ne l'a pas).
+    """
+    global _selected_template
+    _geometries[geometry.name] = geometry
+    _selected_template = geometry.name
+
+def line_advances(line, advances):
+    """Chasse de chaque caractère de line, plafonnée à la pleine chasse (1000, aussi pour un glyphe absent)"""
+    try:
+        widths = [advances[code] for code in map(ord, line)]
+    except IndexError:
+        # Caractère hors du plan multilingue de base : pleine chasse
+        widths = [advances[code] if code < ADVANCE_TABLE_SIZE else 1000 for code in map(ord, line)]
+    if widths and max(widths) > 1000:
+        widths = [min(width, 1000) for width in widths]
+    return widths
+
+def line_steps(widths, font_size, char_spacing):
+    """Pas vertical après chaque caractère, arrondi pour garder le PDF compact"""
+    if not widths or min(widths) == 1000:
+        return [char_spacing] * len(widths)
+    squeeze = font_size * NARROW_SQUEEZE / 1000
+    # Peu de chasses différentes dans une ligne (pleine, demi...) : un pas calculé par chasse
+    step_of = {width: round(char_spacing - squeeze * (1000 - width), 2) for width in set(widths)}
+    return [step_of[width] for width in widths]
+
+def visible_char_count(y, steps, margin_bottom):
+    """Nombre de caractères d'une ligne verticale qui restent au-dessus de margin_bottom"""
+    count = 0
+    for step in steps:
+        if y < margin_bottom:
+            break
+        count += 1
+        y -= step
+    return count
+
+def layout_envelope(record, advances=None, geometry=None):
+    """Calcule la mise en page d'une adresse, sans rien dessiner.
+
+    Le texte est d'abord normalisé pour l'écriture verticale (voir
+    normalize_record). La taille est la plus grande des fit_sizes du format
+    (geometry, par défaut celui choisi) pour laquelle toutes les lignes
+    tiennent au-dessus de margin_bottom, d'après la chasse de chaque glyphe
+    (advances, par défaut celle de la police choisie). Si même la plus petite
+    ne suffit pas, les lignes trop longues continuent dans une colonne de plus.
+
+    Retourne un dict avec la taille de police, l'espacement vertical, la
+    position de la grille du code postal, les chiffres du code postal, le
+    nombre de caractères coupés faute de place (hidden) et, pour chaque
+    colonne, son origine (x, y), son texte et le pas vertical après chaque
+    caractère.
+    """
+    if geometry is None:
+        geometry = get_geometry()
+    if advances is None:
+        advances = current_advances()
+    record = normalize_record(record, advances)
+    lines = address_lines(record)
+
+    widths = [line_advances(line, advances) for line in lines]
+    # Hauteur gagnée (en em) par les caractères étroits, sauf le dernier dont seul le haut compte
+    narrow = [(1000 * (len(w) - 1) - sum(w[:-1])) * NARROW_SQUEEZE / 1000 if w else 0 for w in widths]
+
+    x_start, y_start = geometry.x_start, geometry.y_start
+    line_spacing = geometry.line_spacing
+    margin_bottom = geometry.margin_bottom
+    indent_offset = geometry.indent_offset
+    margin_left = geometry.margin_left
+    fit_sizes = geometry.fit_sizes
+
+    def line_y(i, char_spacing):
+        y = y_start - (i * indent_offset)
+        if i == 3:
+            additional_vertical_offset = 6 * char_spacing
+            y -= additional_vertical_offset
+        return y
+
+    def fits(font_size, char_spacing):
+        # Le dernier caractère doit commencer au-dessus de margin_bottom
+        for i, line in enumerate(lines):
+            extent = (len(line) - 1) * char_spacing - font_size * narrow[i]
+            if line_y(i, char_spacing) - extent < margin_bottom:
+                return False
+        return True
+
+    # La plupart des adresses tiennent dans la plus grande taille ; sinon dichotomie,
+    # la hauteur des lignes diminue avec la taille
+    low, high = 0, len(fit_sizes) - 1
+    if fits(*fit_sizes[0]):
+        high = 0
+    while low < high:
+        middle = (low + high) // 2
+        if fits(*fit_sizes[middle]):
+            high = middle
+        else:
+            low = middle + 1
+    font_size, char_spacing = fit_sizes[low]
+    # Rien à couper ni à replier si les lignes tiennent
+    all_fit = low < len(fit_sizes) - 1 or fits(font_size, char_spacing)
+
+    placed_lines = []
+    hidden = 0
+    column = 0
+    for i, line in enumerate(lines):
+        y = line_y(i, char_spacing)
+        steps = line_steps(widths[i], font_size, char_spacing)
+        while True:
+            x = x_start - (column * line_spacing)
+            if x < margin_left:
+                # Plus de colonne libre sur l'enveloppe
+                hidden += len(line)
+                break
+            count = len(line) if all_fit else visible_char_count(y, steps, margin_bottom)
+            column += 1
+            next_x = x_start - (column * line_spacing)
+            if count == len(line) or count == 0 or next_x < margin_left:
+                placed_lines.append((x, y, line[:count], steps[:count]))
+                hidden += len(line) - count
+                break
+            # Suite de la ligne dans une nouvelle colonne, décalée d'un caractère,
+            # coupée de préférence après une espace
+            cut = max(line.rfind(" ", 0, count), line.rfind("\u3000", 0, count)) + 1
+            if cut <= count // 2:
+                cut = count
+            placed_lines.append((x, y, line[:cut].rstrip(), steps[:cut]))
+            rest = len(line) - len(line[cut:].lstrip())
+            line, steps = line[rest:], steps[rest:]
+            y = line_y(i, char_spacing) - char_spacing
+
+    return {
+        "geometry": geometry,
+        "font_size": font_size,
+        "char_spacing": char_spacing,
+        "margin_bottom": margin_bottom,
+        "postal_x": geometry.postal_x,
+        "postal_y": geometry.postal_y,
+        "case_width": geometry.case_width,
+        "case_height": geometry.case_height,
+        "spacing": geometry.spacing,
+        "postal_digits": record["postal_code"],
+        "hidden": hidden,
+        "lines": placed_lines,
+    }
+
+@functools.lru_cache(maxsize=256)
+def cached_layout(fields, font_path=None, template=None):
+    """layout_envelope mis en cache, fields étant le tuple des valeurs de ADDRESS_FIELDS.
+
+    Sans font_path, les chasses sont approchées (voir fallback_advances).
+    """
+    advances = glyph_advances(font_path) if font_path else fallback_advances()
+    return layout_envelope(dict(zip(ADDRESS_FIELDS, fields)), advances, get_geometry(template))
+
+def draw_envelope(c, record, use_forms=True, geometry=None):
+    """Dessine une enveloppe sur la page courante du canvas (décalage code postal).
+
+    Avec use_forms, les éléments fixes sont dessinés une seule fois dans un
+    Form XObject du document et chaque page n'y fait que référence.
+    """
+    with STATS.timer("layout"):
+        layout = layout_envelope(record, geometry=geometry)
+
+    with STATS.timer("draw"):
+        geometry = layout["geometry"]
+        postal_x, postal_y = geometry.postal_x, geometry.postal_y
+        case_width, case_height, spacing = geometry.case_width, geometry.case_height, geometry.spacing
+
+        c.setFont(FONT_NAME, layout["font_size"])
+
+        if use_forms:
+            if not c.hasForm(geometry.form_name):
+                c.beginForm(geometry.form_name, 0, 0, *geometry.page_size)
+                draw_postal_grid(c, postal_x, postal_y, case_width, case_height, spacing)
+                c.endForm()
+            c.doForm(geometry.form_name)
+        else:
+            draw_postal_grid(c, postal_x, postal_y, case_width, case_height, spacing)
+
+        c.setFillColorRGB(0, 0, 0)
+        c.setFont(FONT_NAME, 12)
+        for current_x, char in zip(geometry.digit_x, layout["postal_digits"]):
+            char_width = c.stringWidth(char, FONT_NAME, 12)
+            c.drawString(current_x + (case_width - char_width) / 2, geometry.digit_y, char)
+
+        c.setFont(FONT_NAME, layout["font_size"])
+
+        glyphs = 0
+        for x, y, text, steps in layout["lines"]:
+            draw_vertical_line(c, x, y, text, steps, layout["font_size"])
+            glyphs += len(text)
+
+    STATS.count("envelopes")
+    STATS.count("glyphs", glyphs)
+
+def create_pdf(output, record, geometry=None):
+    """Crée un PDF d'une page pour une adresse, au format geometry (par défaut celui choisi).
+
+    output est un chemin ou un fichier binaire ouvert (sys.stdout.buffer,
+    entrée d'une archive ZIP...). Avec None, le PDF est rendu en mémoire et
+    retourné en bytes.
+    """
+    from reportlab.pdfgen import canvas
+    ensure_japanese_font()
+    geometry = geometry or get_geometry()
+    buffer = io.BytesIO() if output is None else None
+    c = canvas.Canvas(output if buffer is None else buffer, pagesize=geometry.page_size)
+    draw_envelope(c, record, geometry=geometry)
+    with STATS.timer("save"):
+        c.save()
+    if buffer is not None:
+        return buffer.getvalue()
+
+# À incrémenter à chaque changement du rendu : les PDF déjà en cache ne sont plus réutilisés
+LAYOUT_VERSION = 3
+
+class PdfCache:
+    """Cache disque des PDF d'une enveloppe, indexé par le contenu.
+
+    La clé est l'empreinte des champs de l'adresse (sans les espaces de
+    début et de fin), de la police et de LAYOUT_VERSION : une adresse déjà
+    rendue est resservie sans refaire le PDF. Au-delà de max_bytes, les
+    fichiers utilisés le moins récemment sont supprimés.
+    """
+
+    DEFAULT_MAX_MB = 200
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or os.path.join(cache_dir(), "pdf")
+        if max_bytes is None:
+            max_bytes = load_settings().get("pdf_cache_max_mb", self.DEFAULT_MAX_MB) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Du moins récent au plus récent, d'après la date de modification
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pdf"):
+                st = entry.stat()
+                entries.append((st.st_mtime, entry.name[:-4], st.st_size))
+        entries.sort()
+        self.entries = collections.OrderedDict((key, size) for _, key, size in entries)
+        self.total_bytes = sum(self.entries.values())
+        # La taille maximale a pu être réduite depuis le dernier lancement
+        self.evict()
+
+    def key(self, record, font_path):
+        sha = hashlib.sha256()
+        for field in ADDRESS_FIELDS:
+            sha.update((record.get(field) or "").strip().encode("utf-8"))
+            sha.update(b"\x1f")
+        sha.update(get_font_cache().digest(font_path).encode("ascii"))
+        # Les polices de secours ne comptent que si l'adresse en a besoin
+        text = "".join(record.get(field) or "" for field in ADDRESS_FIELDS)
+        if not glyph_coverage(font_path).issuperset(text):
+            for path in fallback_fonts():
+                sha.update(get_font_cache().digest(path).encode("ascii"))
+        sha.update(f"layout={LAYOUT_VERSION}".encode("ascii"))
+        # La description du format, pas seulement son nom : un format personnalisé peut changer
+        sha.update(get_geometry().spec.encode("utf-8"))
+        return sha.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".pdf")
+
+    def get(self, key):
+        """Chemin du PDF en cache, ou None"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                STATS.count("pdf_cache_misses")
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            STATS.count("pdf_cache_hits")
+        path = self.path(key)
+        try:
+            # La date de modification sert d'ordre LRU entre deux lancements
+            os.utime(path)
+        except OSError:
+            # Supprimé par un autre processus
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+        return path
+
+    def put(self, key, data):
+        """Enregistre le PDF data (bytes) sous key, puis fait de la place"""
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        size = len(data)
+        with self.lock:
+            self.total_bytes += size - self.entries.get(key, 0)
+            self.entries[key] = size
+            self.entries.move_to_end(key)
+            self.evict()
+        return path
+
+    def evict(self):
+        """Supprime les entrées les moins récentes tant que le cache dépasse max_bytes"""
+        # La dernière entrée (celle qu'on vient d'écrire) est toujours gardée
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def record_key(self, record, font_path=None):
+        font_path = font_path or _selected_font_path
+        if not font_path:
+            raise RuntimeError("Aucune police japonaise sélectionnée")
+        return self.key(record, font_path)
+
+    def render(self, record, font_path=None):
+        """PDF d'une enveloppe, depuis le cache ou rendu puis mis en cache.
+
+        Retourne (chemin, True si le PDF venait du cache).
+        """
+        key = self.record_key(record, font_path)
+        path = self.get(key)
+        if path:
+            return path, True
+        return self.put(key, create_pdf(None, record)), False
+
+    def fetch(self, record, font_path=None):
+        """Comme render, mais retourne (PDF en bytes, True si le PDF venait du cache)"""
+        key = self.record_key(record, font_path)
+        path = self.get(key)
+        if path:
+            with open(path, "rb") as f:
+                return f.read(), True
+        data = create_pdf(None, record)
+        self.put(key, data)
+        return data, False
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+def render_each(records, directory, cache=None):
+    """Un PDF par enveloppe dans directory (envelope_00001.pdf...), via le cache.
+
+    Retourne (nombre, durée en s).
+    """
+    start = time.perf_counter()
+    cache = cache or PdfCache()
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for record in records:
+        count += 1
+        cached, _ = cache.render(record)
+        target = os.path.join(directory, f"envelope_{count:05d}.pdf")
+        shutil.copyfile(cached, target)
+    return count, time.perf_counter() - start
+
+def render_zip(records, output, cache=None, progress_every=1000):
+    """Un PDF par enveloppe dans une archive ZIP écrite au fil de l'eau.
+
+    output est un chemin ou un fichier binaire, qui peut être un tube
+    (sys.stdout.buffer) : rien n'est écrit ailleurs. Les PDF sont stockés
+    sans recompression, ils sont déjà compressés. Avec cache (PdfCache), les
+    adresses déjà rendues sont reprises du cache. Retourne (nombre, durée en s).
+    """
+    start = time.perf_counter()
+    ensure_japanese_font()
+    count = 0
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as archive:
+        for record in records:
+            count += 1
+            name = f"envelope_{count:05d}.pdf"
+            with STATS.timer("write"):
+                if cache is not None:
+                    archive.writestr(name, cache.fetch(record)[0])
+                else:
+                    with archive.open(name, "w") as f:
+                        create_pdf(f, record)
+            if progress_every and count % progress_every == 0:
+                elapsed = time.perf_counter() - start
+                log.info("%d enveloppes (%.1f env/s)", count, count / elapsed)
+    return count, time.perf_counter() - start
+
+def read_recipients(path, fmt=None, fields=ADDRESS_FIELDS):
+    """Lit les destinataires d'un fichier CSV ou JSONL, ou d'un carnet d'adresses, un dict par ligne.
+
+    Le CSV doit avoir une ligne d'en-tête avec les noms de fields.
+    Le format est déduit de l'extension si fmt n'est pas donné. Les lignes
+    dont tous les champs sont vides sont ignorées (pas d'enveloppe blanche).
+    """
+    if fmt is None:
+        if path.lower().endswith((".db", ".sqlite", ".sqlite3")):
+            fmt = "book"
+        else:
+            fmt = "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+    if fmt == "book":
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Carnet d'adresses introuvable: {path}")
+        with AddressBook(path) as book:
+            yield from book.records()
+        return
+
+    # utf-8-sig : accepte les CSV exportés depuis Excel (BOM)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                record = {field: row.get(field) or "" for field in fields}
+                if any(str(value).strip() for value in record.values()):
+                    yield record
+        elif fmt == "jsonl":
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_number}: JSON invalide ({e})")
+                record = {field: row.get(field) or "" for field in fields}
+                if any(str(value).strip() for value in record.values()):
+                    yield record
+        else:
+            raise ValueError(f"Format inconnu: {fmt}")
+
+# Tri postal et dédoublonnage ----------------------------------------------------
+#
+# Pour les tarifs 区分郵便 de Japan Post, le courrier doit être remis trié par
+# code postal. presort_records trie les adresses par clé de dédoublonnage
+# (code postal d'abord, voir dedupe_key) et ne garde que la première de chaque
+# clé. Le tri est externe : les adresses sont triées par paquets de
+# chunk_size gardés dans des fichiers temporaires, puis fusionnées, la mémoire
+# ne dépend donc pas de la taille du fichier.
+
+PRESORT_CHUNK = 100000
+# Chiffres du code postal qui forment un groupe (3 : 160-xxxx, zone de tri)
+PRESORT_PREFIX = 3
+# Adresses par pickle dans les fichiers temporaires
+PRESORT_BATCH = 1000
+DEDUPE_DASH = re.compile("[%s]" % re.escape(DASHES))
+FIRST_ITEM = operator.itemgetter(0)
+
+def dedupe_key(record):
+    """Clé de dédoublonnage : les champs lus par validate_address, normalisés.
+
+    Code postal réduit à ses chiffres (un code invalide trie après les
+    autres), puis NFKC, minuscules, sans espaces et tirets unifiés :
+    "〒160ｰ0007 / 荒木町11−1" et "1600007 / 荒木町 11-1" ont la même clé.
+    """
+    postal = postal_digits(record.get("postal_code"))
+    # Les champs sont normalisés d'un coup ; \0 les sépare (\x1f compte comme un espace)
+    text = "\0".join(record.get(field) or "" for field in ADDRESS_FIELDS[1:])
+    text = WHITESPACE.sub("", unicodedata.normalize("NFKC", text).lower())
+    return ("0" if len(postal) == 7 else "1") + postal + "\0" + DEDUPE_DASH.sub("-", text)
+
+def postal_group(key, prefix_length=PRESORT_PREFIX):
+    """Groupe d'une clé de dedupe_key : les prefix_length premiers chiffres, ou "" si code invalide"""
+    return key[1:1 + prefix_length] if key[0] == "0" else ""
+
+def _write_run(run, directory, number):
+    """Écrit un paquet trié de (clé, adresse) par pickles de PRESORT_BATCH"""
+    path = os.path.join(directory, f"run_{number:05d}.bin")
+    with open(path, "wb") as f:
+        for offset in range(0, len(run), PRESORT_BATCH):
+            pickle.dump(run[offset:offset + PRESORT_BATCH], f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield from pickle.load(f)
+            except EOFError:
+                return
+
+def presort_records(records, prefix_length=PRESORT_PREFIX, chunk_size=PRESORT_CHUNK, report=None,
+                    temp_dir=None):
+    """Adresses triées par code postal, sans doublons (voir dedupe_key), au fil de l'eau.
+
+    À clé égale, la première adresse du fichier est gardée. Si report (dict)
+    est fourni, il reçoit au fur et à mesure : read (adresses lues),
+    duplicates (écartées), runs (paquets triés) et groups (préfixe du code
+    postal -> nombre d'adresses gardées, dans l'ordre ; "" pour les codes
+    invalides).
+    """
+    if report is None:
+        report = {}
+    report.update(read=0, duplicates=0, runs=0, groups={})
+    groups = report["groups"]
+    with tempfile.TemporaryDirectory(prefix="envejp_presort_", dir=temp_dir) as directory:
+        runs = []
+        run = []
+        read = 0
+        with STATS.timer("presort_split"):
+            for read, record in enumerate(records, 1):
+                run.append((dedupe_key(record), record))
+                if len(run) >= chunk_size:
+                    run.sort(key=FIRST_ITEM)
+                    runs.append(_write_run(run, directory, len(runs)))
+                    run = []
+            run.sort(key=FIRST_ITEM)
+        report["read"] = read
+        report["runs"] = len(runs) + bool(run)
+        # Un seul paquet (petit fichier) : pas de fichier temporaire
+        if runs:
+            if run:
+                runs.append(_write_run(run, directory, len(runs)))
+            run = None
+            # sort et heapq.merge sont stables : à clé égale, l'ordre du fichier est gardé
+            merged = heapq.merge(*map(_read_run, runs), key=FIRST_ITEM)
+        else:
+            merged = run
+
+        previous = None
+        for key, record in merged:
+            if key == previous:
+                report["duplicates"] += 1
+                continue
+            previous = key
+            group = postal_group(key, prefix_length)
+            groups[group] = groups.get(group, 0) + 1
+            yield record
+
+def write_recipients(path, records, fmt=None, fields=ADDRESS_FIELDS):
+    """Écrit les adresses en CSV (avec en-tête) ou JSONL, comme les lit read_recipients"""
+    if fmt is None:
+        fmt = "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fields, extrasaction="ignore")
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+                count += 1
+        else:
+            for record in records:
+                f.write(json.dumps({field: record.get(field) or "" for field in fields},
+                                   ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+# Carnet d'adresses --------------------------------------------------------------
+#
+# Base SQLite locale (config_dir()/addressbook.db). La recherche passe par :
+#  - un index FTS5 "trigram" sur l'entreprise, le destinataire, l'adresse et la
+#    lecture en kana : à partir de 3 caractères, le texte est trouvé n'importe
+#    où, sans découpage en mots (qui n'existe pas en japonais) ;
+#  - pour des mots de 1 ou 2 caractères seulement, une recherche par préfixe
+#    sur une table de clés indexée (B-tree) : chaque champ, et chaque mot d'un
+#    champ (山田 trouve 人事部・山田様), par intervalle pour que l'index serve.
+# Le texte est indexé et cherché sous la même forme (voir search_key).
+
+# "kana" : lecture facultative (ex. ヤマダタロウ), cherchée comme le reste
+BOOK_FIELDS = ADDRESS_FIELDS + ("kana",)
+COMPANY_PREFIXES = ("株式会社", "有限会社", "合同会社", "(株)", "(有)")
+HIRAGANA_TO_KATAKANA = {code: code + 0x60 for code in range(0x3041, 0x3097)}
+# Séparateurs de mots pour les clés de préfixe (après NFKC)
+WORD_BREAK = re.compile(r"[\s・,、()]+")
+# Borne haute d'une recherche par préfixe : après tout caractère du plan de base
+PREFIX_END = "\uffff"
+
+def search_key(text):
+    """Forme cherchable : NFKC (ｶﾞ -> ガ, Ａ -> a), minuscules, sans espaces, hiragana -> katakana"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return WHITESPACE.sub("", text).translate(HIRAGANA_TO_KATAKANA)
+
+def book_path():
+    return os.path.join(config_dir(), "addressbook.db")
+
+class AddressBook:
+    """Carnet d'adresses SQLite avec recherche instantanée (voir search)"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS contacts (
+            id INTEGER PRIMARY KEY,
+            postal_code TEXT NOT NULL DEFAULT '',
+            address1 TEXT NOT NULL DEFAULT '',
+            address2 TEXT NOT NULL DEFAULT '',
+            company TEXT NOT NULL DEFAULT '',
+            recipient TEXT NOT NULL DEFAULT '',
+            kana TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS contact_keys (
+            key TEXT NOT NULL,
+            contact_id INTEGER NOT NULL,
+            PRIMARY KEY (key, contact_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS contact_keys_contact ON contact_keys (contact_id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5(text, tokenize='trigram');
+    """
+
+    # Requêtes fixes avec paramètres : sqlite3 garde chacune préparée d'un appel à l'autre
+    GET = "SELECT postal_code, address1, address2, company, recipient, kana FROM contacts WHERE id = ?"
+    ALL = "SELECT postal_code, address1, address2, company, recipient, kana FROM contacts ORDER BY id"
+    MAX_ID = "SELECT max(id) FROM contacts"
+    SEARCH_FTS = "SELECT rowid, text FROM contacts_fts WHERE contacts_fts MATCH ?"
+    SEARCH_PREFIX = ("SELECT k.contact_id, f.text FROM contact_keys AS k "
+                     "JOIN contacts_fts AS f ON f.rowid = k.contact_id "
+                     "WHERE k.key >= ? AND k.key < ?")
+    SEARCH_TEXT = "SELECT rowid, text FROM contacts_fts"
+    COUNT_PREFIX = ("SELECT count(*) FROM (SELECT 1 FROM contact_keys "
+                    "WHERE key >= ? AND key < ? LIMIT ?)")
+    INSERT = ("INSERT INTO contacts (id, postal_code, address1, address2, company, recipient, kana) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?)")
+    INSERT_FTS = "INSERT INTO contacts_fts (rowid, text) VALUES (?, ?)"
+    INSERT_KEY = "INSERT OR IGNORE INTO contact_keys (key, contact_id) VALUES (?, ?)"
+
+    def __init__(self, path=None):
+        import sqlite3
+        self.path = path or book_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(self.SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT count(*) FROM contacts").fetchone()[0]
+
+    @staticmethod
+    def index_entries(record):
+        """Texte indexé (FTS) et clés de préfixe d'une adresse"""
+        keys = set()
+        for field in ("company", "recipient", "kana", "address1"):
+            value = unicodedata.normalize("NFKC", record.get(field) or "")
+            keys.add(search_key(value))
+            keys.update(map(search_key, WORD_BREAK.split(value)))
+        company = search_key(record.get("company") or "")
+        for prefix in COMPANY_PREFIXES:
+            # 株式会社サンプル se trouve aussi en tapant サン
+            if company.startswith(prefix):
+                keys.add(company[len(prefix):])
+        keys.discard("")
+        # Séparateur : une recherche ne chevauche pas deux champs
+        text = "|".join(search_key(record.get(field) or "") for field in BOOK_FIELDS)
+        return text, keys
+
+    def import_records(self, records):
+        """Ajoute des adresses (dicts de BOOK_FIELDS) en une seule transaction.
+
+        Les lignes entièrement vides sont ignorées. Retourne l'identifiant de
+        la dernière adresse ajoutée (None si aucune).
+        """
+        rows, fts_rows, key_rows = [], [], []
+        with self.db:
+            contact_id = self.db.execute(self.MAX_ID).fetchone()[0] or 0
+            for record in records:
+                values = tuple((record.get(field) or "").strip() for field in BOOK_FIELDS)
+                if not any(values):
+                    continue
+                contact_id += 1
+                rows.append((contact_id, *values))
+                text, keys = self.index_entries(record)
+                fts_rows.append((contact_id, text))
+                key_rows.extend((key, contact_id) for key in keys)
+            self.db.executemany(self.INSERT, rows)
+            self.db.executemany(self.INSERT_FTS, fts_rows)
+            self.db.executemany(self.INSERT_KEY, key_rows)
+        return rows[-1][0] if rows else None
+
+    def add(self, record):
+        """Ajoute une adresse ; retourne son identifiant"""
+        return self.import_records([record])
+
+    def delete(self, contact_id):
+        with self.db:
+            self.db.execute("DELETE FROM contacts WHERE id = ?", (contact_id,))
+            self.db.execute("DELETE FROM contacts_fts WHERE rowid = ?", (contact_id,))
+            self.db.execute("DELETE FROM contact_keys WHERE contact_id = ?", (contact_id,))
+
+    def get(self, contact_id):
+        row = self.db.execute(self.GET, (contact_id,)).fetchone()
+        return dict(zip(BOOK_FIELDS, row)) if row else None
+
+    def records(self):
+        """Toutes les adresses, dans l'ordre d'ajout (entrée de batch, voir read_recipients)"""
+        for row in self.db.execute(self.ALL):
+            yield dict(zip(ADDRESS_FIELDS, row))
+
+    # Lignes candidates examinées au plus par search : un mot court qui ne se
+    # trouve nulle part ferait sinon parcourir tout le carnet (~5 µs par ligne)
+    SEARCH_SCAN = 2000
+
+    def search(self, query, limit=20, scan=SEARCH_SCAN):
+        """Adresses dont le texte contient chaque mot de query : liste de (identifiant, adresse).
+
+        Avec au moins un mot de 3 caractères, chaque mot est cherché n'importe
+        où ; sinon, l'un des mots doit commencer un champ ou un mot du champ
+        (si aucun ne le fait, le texte des adresses est parcouru).
+        Au-delà de scan lignes candidates (None = pas de limite), la recherche
+        s'arrête avec les résultats trouvés.
+        """
+        terms = [key for key in map(search_key, WHITESPACE.split(query)) if key]
+        if not terms:
+            return []
+        long_terms = [term for term in terms if len(term) >= 3]
+        if long_terms:
+            # Chaque mot entre guillemets : recherche de la chaîne, pas de la syntaxe FTS5
+            match = " AND ".join('"%s"' % term.replace('"', '""') for term in long_terms)
+            cursor = self.db.execute(self.SEARCH_FTS, (match,))
+            rest = [term for term in terms if len(term) < 3]
+        else:
+            # Le mot qui commence le moins de clés (au moins une) sert de préfixe, les autres
+            # sont vérifiés sur le texte (les clés sont triées : le plus fréquent ferait tout
+            # parcourir). Un mot qui ne commence aucune clé peut être au milieu d'un champ.
+            counts = {term: self.db.execute(self.COUNT_PREFIX,
+                                            (term, term + PREFIX_END, scan or -1)).fetchone()[0]
+                      for term in terms}
+            prefixes = sorted((term for term in terms if counts[term]), key=counts.get)
+            if prefixes:
+                prefix = prefixes[0]
+                cursor = self.db.execute(self.SEARCH_PREFIX, (prefix, prefix + PREFIX_END))
+                rest = [term for term in terms if term != prefix]
+            else:
+                # Aucun mot ne commence un champ : parcours du texte
+                cursor = self.db.execute(self.SEARCH_TEXT)
+                rest = terms
+        # Le curseur est parcouru au fur et à mesure : seules les lignes nécessaires sont lues
+        found = []
+        for contact_id, text in itertools.islice(cursor, scan):
+            # Une adresse peut avoir plusieurs clés qui commencent par le préfixe
+            if contact_id in found or not all(term in text for term in rest):
+                continue
+            found.append(contact_id)
+            if len(found) == limit:
+                break
+        cursor.close()
+        return [(contact_id, self.get(contact_id)) for contact_id in found]
+
+class RenderCancelled(Exception):
+    """Le rendu a été annulé avant la fin (aucun fichier n'est écrit)"""
+
+def render_batch(records, filepath, progress_every=1000, progress=None, cancel_event=None, geometry=None):
+    """Rend toutes les adresses dans un seul PDF, une page par enveloppe.
+
+    filepath est un chemin ou un fichier binaire ouvert (sys.stdout.buffer...).
+    "JapaneseFont" doit déjà être choisie, et le format est geometry (par
+    défaut celui choisi, voir select_template). Toutes les progress_every
+    enveloppes, progress(nombre) est appelé s'il est fourni. Si cancel_event
+    (threading.Event) est positionné, lève RenderCancelled sans écrire le
+    fichier. Retourne (nombre, durée en s).
+    """
+    from reportlab.pdfgen import canvas
+    start = time.perf_counter()
+    ensure_japanese_font()
+    geometry = geometry or get_geometry()
+    c = canvas.Canvas(filepath, pagesize=geometry.page_size)
+    count = 0
+    for record in records:
+        if cancel_event is not None and cancel_event.is_set():
+            raise RenderCancelled(f"Annulé après {count} enveloppes")
+        draw_envelope(c, record, geometry=geometry)
+        c.showPage()
+        count += 1
+        if progress_every and count % progress_every == 0:
+            elapsed = time.perf_counter() - start
+            log.info("%d enveloppes (%.1f env/s)", count, count / elapsed)
+            if progress:
+                progress(count)
+    if progress:
+        progress(count)
+    with STATS.timer("save"):
+        c.save()
+    return count, time.perf_counter() - start
+
+# Imposition : plusieurs enveloppes par feuille ---------------------------------
+#
+# La feuille est découpée en cases (étiquettes, ou morceaux d'A4 à couper).
+# L'enveloppe y est dessinée telle quelle (même grille du code postal, mêmes
+# colonnes de texte), réduite pour tenir dans la case et centrée.
+
+# nom: description, format de la feuille, colonnes × lignes, taille d'une case,
+# marges gauche/haut, écarts entre cases, traits de coupe
+SHEET_TEMPLATES = {
+    "a4-2": {"label": "A4 paysage, 2 enveloppes A5 en taille réelle", "page": (A4[1], A4[0]),
+             "grid": (2, 1), "cell": (148.5 * mm, 210 * mm), "margin": (0, 0), "gap": (0, 0), "cut_lines": True},
+    "a4-4": {"label": "A4, 4 enveloppes A6 (réduites à 71 %)", "page": A4,
+             "grid": (2, 2), "cell": (105 * mm, 148.5 * mm), "margin": (0, 0), "gap": (0, 0), "cut_lines": True},
+    "label-4": {"label": "Étiquettes A4 4 面 (105 × 148,5 mm)", "page": A4,
+                "grid": (2, 2), "cell": (105 * mm, 148.5 * mm), "margin": (0, 0), "gap": (0, 0), "cut_lines": False},
+    "label-6": {"label": "Étiquettes A4 6 面 (105 × 99 mm)", "page": A4,
+                "grid": (2, 3), "cell": (105 * mm, 99 * mm), "margin": (0, 0), "gap": (0, 0), "cut_lines": False},
+}
+
+SHEET_FORM = "SheetCutLines"
+
+@functools.lru_cache(maxsize=None)
+def sheet_slots(template, envelope_size=A5):
+    """Position de chaque case d'un modèle de feuille, calculée une seule fois.
+
+    Retourne un tuple de (x, y, échelle) dans l'ordre de lecture japonais
+    (de droite à gauche, puis de haut en bas) : (x, y) est l'origine de
+    l'enveloppe (de taille envelope_size) réduite et centrée dans la case.
+    """
+    envelope_width, envelope_height = envelope_size
+    sheet = SHEET_TEMPLATES[template]
+    page_width, page_height = sheet["page"]
+    columns, rows = sheet["grid"]
+    cell_width, cell_height = sheet["cell"]
+    margin_left, margin_top = sheet["margin"]
+    gap_x, gap_y = sheet["gap"]
+    scale = min(1.0, cell_width / envelope_width, cell_height / envelope_height)
+    slots = []
+    for row in range(rows):
+        for column in reversed(range(columns)):
+            cell_x = margin_left + column * (cell_width + gap_x)
+            cell_y = page_height - margin_top - (row + 1) * cell_height - row * gap_y
+            slots.append((cell_x + (cell_width - envelope_width * scale) / 2,
+                          cell_y + (cell_height - envelope_height * scale) / 2, scale))
+    return tuple(slots)
+
+def draw_cut_lines(c, template):
+    """Traits de coupe gris clair entre les cases (une seule fois par document, en Form XObject)"""
+    if not c.hasForm(SHEET_FORM):
+        sheet = SHEET_TEMPLATES[template]
+        page_width, page_height = sheet["page"]
+        columns, rows = sheet["grid"]
+        cell_width, cell_height = sheet["cell"]
+        margin_left, margin_top = sheet["margin"]
+        c.beginForm(SHEET_FORM)
+        c.saveState()
+        c.setStrokeColorRGB(0.8, 0.8, 0.8)
+        c.setLineWidth(0.3)
+        for column in range(1, columns):
+            x = margin_left + column * cell_width
+            c.line(x, 0, x, page_height)
+        for row in range(1, rows):
+            y = page_height - margin_top - row * cell_height
+            c.line(0, y, page_width, y)
+        c.restoreState()
+        c.endForm()
+    c.doForm(SHEET_FORM)
+
+def render_sheets(records, filepath, template, progress_every=1000, progress=None, geometry=None):
+    """Comme render_batch, mais plusieurs enveloppes par page selon le modèle de SHEET_TEMPLATES.
+
+    Retourne (nombre d'enveloppes, nombre de pages, durée en s).
+    """
+    from reportlab.pdfgen import canvas
+    start = time.perf_counter()
+    ensure_japanese_font()
+    geometry = geometry or get_geometry()
+    sheet = SHEET_TEMPLATES[template]
+    slots = sheet_slots(template, geometry.page_size)
+    c = canvas.Canvas(filepath, pagesize=sheet["page"])
+    count = 0
+    for record in records:
+        slot = count % len(slots)
+        if slot == 0:
+            if count:
+                c.showPage()
+            if sheet["cut_lines"]:
+                draw_cut_lines(c, template)
+        x, y, scale = slots[slot]
+        c.saveState()
+        c.translate(x, y)
+        c.scale(scale, scale)
+        draw_envelope(c, record, geometry=geometry)
+        c.restoreState()
+        count += 1
+        if progress_every and count % progress_every == 0:
+            elapsed = time.perf_counter() - start
+            log.info("%d enveloppes (%.1f env/s)", count, count / elapsed)
+            if progress:
+                progress(count)
+    if count:
+        c.showPage()
+    with STATS.timer("save"):
+        c.save()
+    pages = -(-count // len(slots))
+    return count, pages, time.perf_counter() - start
+
+def _init_render_worker(font_path, stats_enabled=False, geometry=None, fallbacks=None):
+    """Initialisation d'un processus de rendu : la police est enregistrée une seule fois"""
+    # Avec fork, le worker hérite des mesures du processus principal
+    STATS.reset()
+    STATS.enabled = stats_enabled
+    register_japanese_font(font_path)
+    if geometry is not None:
+        install_geometry(geometry)
+    if fallbacks is not None:
+        set_fallback_fonts(fallbacks)
+
+def _render_shard(job):
+    """Rend un lot contigu d'adresses dans son propre PDF (exécuté dans un worker)"""
+    shard_index, records, filepath = job
+    count, elapsed = render_batch(records, filepath, progress_every=0)
+    # Les mesures du lot sont renvoyées au processus principal puis remises à zéro
+    stats = STATS.to_dict()
+    STATS.reset()
+    return shard_index, filepath, count, stats
+
+def shard_path(filepath, shard_index):
+    """envelopes.pdf -> envelopes_0001.pdf"""
+    root, ext = os.path.splitext(filepath)
+    return f"{root}_{shard_index + 1:04d}{ext or '.pdf'}"
+
+def merge_pdfs(paths, filepath):
+    """Concatène les PDF donnés, dans l'ordre, dans filepath (nécessite pypdf)"""
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        raise RuntimeError("La fusion des lots nécessite pypdf (pip install pypdf), "
+                           "ou utilisez --split pour garder des fichiers numérotés")
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    with open(filepath, "wb") as f:
+        writer.write(f)
+
+def render_parallel(records, filepath, font_path, workers=None, shard_size=500, split=False):
+    """Rend les adresses sur plusieurs processus.
+
+    Les adresses sont découpées en lots contigus de shard_size, chaque worker
+    enregistre "JapaneseFont" une fois au démarrage puis rend ses lots. Les
+    lots sont ensuite fusionnés dans l'ordre dans filepath, ou gardés comme
+    fichiers numérotés si split est vrai. Retourne (nombre, durée en s, fichiers).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    start = time.perf_counter()
+    records = list(records)
+    if split:
+        shard_dir = None
+        make_path = lambda index: shard_path(filepath, index)
+    else:
+        shard_dir = tempfile.mkdtemp(prefix="envejp_")
+        make_path = lambda index: os.path.join(shard_dir, f"shard_{index:06d}.pdf")
+
+    jobs = []
+    for shard_index, offset in enumerate(range(0, len(records), shard_size)):
+        jobs.append((shard_index, records[offset:offset + shard_size], make_path(shard_index)))
+
+    count = 0
+    paths = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker,
+                                 initargs=(font_path, STATS.enabled, get_geometry(),
+                                           _fallback_fonts)) as executor:
+            # map() conserve l'ordre des lots
+            for shard_index, path, shard_count, stats in executor.map(_render_shard, jobs):
+                count += shard_count
+                paths.append(path)
+                if STATS.enabled:
+                    STATS.merge(stats)
+
+        if not split:
+            with STATS.timer("merge"):
+                merge_pdfs(paths, filepath)
+            paths = [filepath]
+    finally:
+        if shard_dir:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+    return count, time.perf_counter() - start, paths
+
+# Volumes et reprise -------------------------------------------------------------
+#
+# Un canvas reportlab garde toutes ses pages en mémoire jusqu'à save() : pour
+# un très gros envoi, render_volumes découpe le PDF en volumes (envoi_0001.pdf,
+# envoi_0002.pdf...) de max_pages pages ou d'environ max_mb Mo, la mémoire
+# redescend à chaque volume. Après chaque volume, le manifeste
+# (envoi.manifest.json) note les volumes terminés et la prochaine adresse à
+# rendre : relancé avec resume, un envoi interrompu reprend là où il s'était
+# arrêté.
+
+MANIFEST_VERSION = 1
+# Taille estimée d'une page tant qu'aucun volume n'a été écrit (pour max_mb)
+VOLUME_BYTES_PER_PAGE = 2048
+
+def reset_peak_rss():
+    """Remet à zéro le pic de mémoire du processus (Linux) ; retourne False si impossible"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_kb():
+    """Pic de mémoire (RSS) du processus en Ko, depuis le dernier reset_peak_rss() si possible"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sur macOS, en kilo-octets sur Linux
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def manifest_path(filepath):
+    """envoi.pdf -> envoi.manifest.json"""
+    return f"{os.path.splitext(filepath)[0]}.manifest.json"
+
+def load_manifest(filepath, source):
+    """Manifeste d'un envoi à reprendre, vérifié (source identique, volumes intacts).
+
+    Retourne None s'il n'y a pas de manifeste, lève ValueError s'il ne
+    correspond pas à cet envoi.
+    """
+    path = manifest_path(filepath)
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        raise ValueError(f"{path}: manifeste illisible ({e})")
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("source") != source:
+        raise ValueError(f"{path}: l'envoi a changé depuis (fichier, police ou format), "
+                         "relancez sans --resume")
+    for volume in manifest["volumes"]:
+        try:
+            size = os.path.getsize(volume["path"])
+        except OSError:
+            size = None
+        if size != volume["bytes"]:
+            raise ValueError(f"{path}: volume manquant ou modifié: {volume['path']}")
+    return manifest
+
+def write_manifest(filepath, manifest):
+    """Écrit le manifeste d'un coup (fichier temporaire puis renommage)"""
+    path = manifest_path(filepath)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def remove_stale_volumes(filepath, keep=()):
+    """Supprime les volumes d'un envoi précédent (envoi_0001.pdf...) qui ne sont pas dans keep"""
+    root, ext = os.path.splitext(os.path.abspath(filepath))
+    pattern = re.compile(re.escape(os.path.basename(root)) + r"_\d{4,}" + re.escape(ext or ".pdf") + r"(\.tmp)?$")
+    keep = {os.path.abspath(path) for path in keep}
+    directory = os.path.dirname(root)
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if pattern.match(name) and path not in keep:
+            os.remove(path)
+            removed += 1
+    if removed:
+        log.info("%d anciens volumes supprimés", removed)
+    return removed
+
+def render_volumes(records, filepath, max_pages=None, max_mb=None, resume=False, source=None,
+                   progress=None, geometry=None):
+    """Rend les adresses dans des volumes successifs, avec un manifeste de reprise.
+
+    Un volume est fermé après max_pages pages, ou quand il atteint environ
+    max_mb Mo (d'après la taille moyenne des pages des volumes précédents).
+    source identifie l'envoi (fichier d'entrée, options...) : avec resume,
+    les adresses déjà rendues d'après le manifeste sont sautées, à condition
+    que source soit la même. Après chaque volume, progress(volume) est appelé
+    s'il est fourni. Retourne (nombre rendu par cet appel, durée en s, volumes),
+    chaque volume étant un dict (path, first, count, bytes, seconds, peak_rss_kb).
+    """
+    start = time.perf_counter()
+    geometry = geometry or get_geometry()
+    source = dict(source or {}, font=get_font_cache().digest(_selected_font_path),
+                  layout=LAYOUT_VERSION, template=geometry.spec)
+    manifest = load_manifest(filepath, source) if resume else None
+    if manifest is None:
+        manifest = {"version": MANIFEST_VERSION, "source": source, "volumes": [],
+                    "next": 0, "complete": False}
+        # Les volumes d'un envoi précédent ne doivent pas se mêler aux nouveaux
+        remove_stale_volumes(filepath)
+    elif manifest["complete"]:
+        return 0, time.perf_counter() - start, manifest["volumes"]
+    else:
+        log.info("Reprise à l'adresse %d (%d volumes déjà rendus)",
+                 manifest["next"] + 1, len(manifest["volumes"]))
+
+    records = itertools.islice(iter(records), manifest["next"], None)
+    count = 0
+    while True:
+        limit = max_pages or sys.maxsize
+        if max_mb:
+            pages = sum(volume["count"] for volume in manifest["volumes"])
+            size = sum(volume["bytes"] for volume in manifest["volumes"])
+            bytes_per_page = size / pages if pages else VOLUME_BYTES_PER_PAGE
+            limit = min(limit, max(1, int(max_mb * 1024 * 1024 / bytes_per_page)))
+        # La première adresse du volume est lue avant de créer le fichier : pas de volume vide
+        first = next(records, None)
+        if first is None:
+            break
+        path = shard_path(filepath, len(manifest["volumes"]))
+        tmp_path = f"{path}.tmp"
+        reset_peak_rss()
+        volume_start = time.perf_counter()
+        pages, _ = render_batch(itertools.chain([first], itertools.islice(records, limit - 1)),
+                                tmp_path, progress_every=0, geometry=geometry)
+        # Un volume n'apparaît sous son nom qu'une fois complet
+        os.replace(tmp_path, path)
+        volume = {
+            "path": path,
+            "first": manifest["next"],
+            "count": pages,
+            "bytes": os.path.getsize(path),
+            "seconds": round(time.perf_counter() - volume_start, 3),
+            "peak_rss_kb": peak_rss_kb(),
+        }
+        manifest["volumes"].append(volume)
+        manifest["next"] += pages
+        write_manifest(filepath, manifest)
+        STATS.count("volumes")
+        count += pages
+        log.info("Volume %s: %d enveloppes, %.1f Mo, pic mémoire %s Ko",
+                 path, pages, volume["bytes"] / 1024 / 1024, volume["peak_rss_kb"])
+        if progress:
+            progress(volume)
+    manifest["complete"] = True
+    write_manifest(filepath, manifest)
+    remove_stale_volumes(filepath, [volume["path"] for volume in manifest["volumes"]])
+    return count, time.perf_counter() - start, manifest["volumes"]
+
+
+# Service HTTP local ------------------------------------------------------------
+#
+# POST /render  adresse JSON (objet, ou liste pour un PDF de plusieurs pages) -> PDF
+# GET  /stats   profondeur de file, rendus en cours, percentiles de latence
+# GET  /health  "ok"
+#
+# Les rendus sont faits par un pool de processus qui gardent "JapaneseFont"
+# enregistrée. Les demandes attendent dans une file bornée : quand elle est
+# pleine, le service répond 503 avec Retry-After au lieu d'accumuler du retard.
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 422: "Unprocessable Entity", 500: "Internal Server Error",
+                503: "Service Unavailable"}
+
+def _render_request(records):
+    """Rendu d'une demande du service (exécuté dans un worker) : PDF en bytes"""
+    if len(records) == 1:
+        return create_pdf(None, records[0])
+    buffer = io.BytesIO()
+    render_batch(records, buffer, progress_every=0)
+    return buffer.getvalue()
+
+def _init_service_worker(font_path, geometry, fallbacks=None):
+    """Worker du service : Ctrl+C est laissé au processus principal, qui arrête le pool"""
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_render_worker(font_path, geometry=geometry, fallbacks=fallbacks)
+
+def _warm_render_worker():
+    """Tâche vide : force le démarrage d'un worker (et le chargement de la police)"""
+    return os.getpid()
+
+def latency_percentiles(samples):
+    """p50/p95/p99 en ms d'une liste de durées en secondes"""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    def pick(q):
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+class RenderService:
+    """Service HTTP asyncio de rendu d'enveloppes (voir run_serve)"""
+
+    MAX_BODY = 1024 * 1024
+    # Nombre de latences gardées pour les percentiles
+    WINDOW = 2000
+
+    def __init__(self, font_path, workers=None, queue_size=64, max_records=500):
+        self.font_path = font_path
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.max_records = max_records
+        self.executor = None
+        self.queue = None
+        self.postal_index = get_postal_index()
+        self.in_flight = 0
+        self.counters = collections.Counter()
+        self.latencies = collections.deque(maxlen=self.WINDOW)
+        self.render_times = collections.deque(maxlen=self.WINDOW)
+        self.started = time.time()
+
+    def start_workers(self):
+        """Démarre le pool et attend que chaque worker ait chargé la police"""
+        from concurrent.futures import ProcessPoolExecutor
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_service_worker,
+                                            initargs=(self.font_path, get_geometry(), _fallback_fonts))
+        pids = {future.result() for future in [self.executor.submit(_warm_render_worker)
+                                               for _ in range(self.workers)]}
+        log.info("%d workers prêts (%s)", self.workers, ", ".join(map(str, sorted(pids))))
+
+    async def serve(self, host, port, ready=None):
+        import asyncio
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        address = server.sockets[0].getsockname()
+        log.info("Service de rendu sur http://%s:%d", address[0], address[1])
+        if ready:
+            ready(address)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in dispatchers:
+                task.cancel()
+
+    async def dispatch(self):
+        """Sort les demandes de la file et les confie au pool, une à la fois par worker"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            records, future = await self.queue.get()
+            self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                pdf = await loop.run_in_executor(self.executor, _render_request, records)
+                if not future.done():
+                    future.set_result(pdf)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.render_times.append(time.perf_counter() - start)
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "uptime_s": round(time.time() - self.started, 1),
+            "requests": dict(self.counters),
+            "latency": latency_percentiles(list(self.latencies)),
+            "render": latency_percentiles(list(self.render_times)),
+        }
+
+    async def handle_connection(self, reader, writer):
+        """Une connexion HTTP/1.1, éventuellement avec plusieurs requêtes (keep-alive)"""
+        import asyncio
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                    break
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Requête invalide"}, keep_alive=False)
+                    break
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.respond(writer, 400, {"error": "Content-Length invalide"}, keep_alive=False)
+                    break
+                if length > self.MAX_BODY:
+                    await self.respond(writer, 413, {"error": "Requête trop grande"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close")
+
+                status, payload, extra = await self.route(method, target.split("?", 1)[0], body)
+                await self.respond(writer, status, payload, keep_alive, extra)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        """Retourne (statut, corps : bytes d'un PDF ou objet JSON, en-têtes en plus)"""
+        if path == "/health":
+            return 200, {"status": "ok"}, {}
+        if path == "/stats":
+            return 200, self.stats(), {}
+        if path != "/render":
+            return 404, {"error": f"Inconnu: {path}"}, {}
+        if method != "POST":
+            return 405, {"error": "POST attendu"}, {"Allow": "POST"}
+        return await self.render(body)
+
+    async def render(self, body):
+        import asyncio
+        start = time.perf_counter()
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError as e:
+            self.counters["invalid"] += 1
+            return 400, {"error": f"JSON invalide: {e}"}, {}
+        items = payload if isinstance(payload, list) else [payload]
+        if not items or not all(isinstance(item, dict) for item in items) or len(items) > self.max_records:
+            self.counters["invalid"] += 1
+            return 400, {"error": f"Attendu : une adresse (objet JSON) ou une liste de 1 à "
+                                  f"{self.max_records} adresses"}, {}
+        records = [{field: str(item.get(field) or "") for field in ADDRESS_FIELDS} for item in items]
+
+        # Les adresses en erreur sont refusées avant de prendre une place dans la file
+        problems = {}
+        for position, _, errors, _ in validate_records(records, self.postal_index):
+            if errors:
+                problems[position] = errors
+        if problems:
+            self.counters["invalid"] += 1
+            return 422, {"errors": problems if isinstance(payload, list) else problems[0]}, {}
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((records, future))
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            return 503, {"error": "File d'attente pleine", "queue_depth": self.queue.qsize()}, {"Retry-After": "1"}
+        try:
+            pdf = await future
+        except Exception as e:
+            log.exception("Render failed")
+            self.counters["failed"] += 1
+            return 500, {"error": str(e)}, {}
+        self.counters["rendered"] += 1
+        self.latencies.append(time.perf_counter() - start)
+        return 200, pdf, {}
+
+    async def respond(self, writer, status, payload, keep_alive=True, extra=None):
+        if isinstance(payload, bytes):
+            content_type, data = "application/pdf", payload
+        else:
+            content_type = "application/json; charset=utf-8"
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+                f"Content-Type: {content_type}",
+                f"Content-Length: {len(data)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{name}: {value}" for name, value in (extra or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+
+
+class EnvelopePreview:
+    """Aperçu de l'enveloppe sur un tk.Canvas, avec la géométrie de layout_envelope.
+
+    Seuls les éléments qui ont changé depuis le dernier affichage (une ligne,
+    les chiffres du code postal) sont redessinés.
+    """
+
+    def __init__(self, parent, height=420):
+        self.height = height
+        page_width, page_height = A5
+        self.scale = height / page_height
+        self.page_height = page_height
+        self.canvas = tk.Canvas(parent, width=round(page_width * self.scale), height=height,
+                                bg="white", highlightthickness=1, highlightbackground="gray")
+        # Ce qui est affiché actuellement, par tag
+        self.shown = {}
+        self.columns = 0
+        self.geometry = None
+
+    def set_geometry(self, geometry):
+        """Nouveau format d'enveloppe : le canvas prend ses proportions et tout est redessiné"""
+        self.geometry = geometry
+        self.scale = self.height / geometry.page_height
+        self.page_height = geometry.page_height
+        self.canvas.delete("all")
+        self.canvas.configure(width=round(geometry.page_width * self.scale))
+        self.shown = {}
+        self.columns = 0
+
+    def point(self, x, y):
+        """Coordonnées PDF (origine en bas à gauche) -> coordonnées du canvas"""
+        return x * self.scale, (self.page_height - y) * self.scale
+
+    def font(self, size):
+        # Taille négative : en pixels, pour suivre l'échelle de l'aperçu
+        return ("TkDefaultFont", -max(1, round(size * self.scale)))
+
+    def draw_grid(self, layout):
+        """Cases du code postal et marge basse : identiques pour toutes les adresses"""
+        postal_x, postal_y = layout["postal_x"], layout["postal_y"]
+        case_width, case_height, spacing = layout["case_width"], layout["case_height"], layout["spacing"]
+        for i in range(8):
+            current_x = postal_x + i * (case_width + spacing)
+            if i == 3:
+                dash_width = case_width / 5
+                dash_x_start = current_x + (case_width - dash_width) / 2
+                dash_y = postal_y + case_height / 2
+                self.canvas.create_line(*self.point(dash_x_start, dash_y),
+                                        *self.point(dash_x_start + dash_width, dash_y), fill="#cc0000")
+            else:
+                self.canvas.create_rectangle(*self.point(current_x, postal_y + case_height),
+                                             *self.point(current_x + case_width, postal_y),
+                                             outline="#cc0000", width=2 if i < 3 else 1)
+        self.canvas.create_line(*self.point(0, layout["margin_bottom"]),
+                                *self.point(layout["geometry"].page_width, layout["margin_bottom"]),
+                                fill="#dddddd", dash=(2, 2))
+
+    def replace(self, tag, key, draw):
+        """Redessine les éléments du tag si key a changé"""
+        if self.shown.get(tag) == key:
+            return
+        self.canvas.delete(tag)
+        if key is not None:
+            draw()
+        self.shown[tag] = key
+
+    def show(self, layout):
+        geometry = layout["geometry"]
+        if geometry is not self.geometry:
+            self.set_geometry(geometry)
+            self.draw_grid(layout)
+
+        digits = layout["postal_digits"]
+
+        def draw_digits():
+            for current_x, char in zip(geometry.digit_x, digits):
+                center_x = current_x + geometry.case_width / 2
+                self.canvas.create_text(*self.point(center_x, geometry.digit_y), text=char,
+                                        anchor="s", font=self.font(12), tags="digits")
+        self.replace("digits", digits, draw_digits)
+
+        font_size = layout["font_size"]
+        lines = layout["lines"]
+        # Une ligne trop longue peut occuper deux colonnes
+        for i in range(max(len(lines), self.columns)):
+            tag = f"line{i}"
+            if i >= len(lines):
+                self.replace(tag, None, None)
+                continue
+            x, y, text, steps = lines[i]
+
+            def draw_line(x=x, y=y, text=text, steps=steps, tag=tag):
+                char_y = y
+                for char, step in zip(text, steps):
+                    self.canvas.create_text(*self.point(x, char_y), text=char,
+                                            anchor="sw", font=self.font(font_size), tags=tag)
+                    char_y -= step
+            self.replace(tag, (x, y, text, tuple(steps), font_size), draw_line)
+        self.columns = len(lines)
+
+        hidden = layout["hidden"]
+
+        def draw_hidden():
+            # Caractères coupés par margin_bottom, comme dans le PDF
+            x = lines[-1][0] if lines else 0
+            self.canvas.create_text(*self.point(x, layout["margin_bottom"]), text=f"+{hidden}",
+                                    anchor="nw", fill="#cc0000", font=self.font(8), tags="hidden")
+        self.replace("hidden", (hidden, len(lines)) if hidden else None, draw_hidden)
+
 class EnvelopeGenerator:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Générateur d'enveloppes japonaises")
-        self.root.geometry("600x500")
+        self.root.geometry("960x560")
         self.root.resizable(True, True)
 
         # Variables
-        self.pdf_temp_path = None
+        # PDF généré, gardé en mémoire jusqu'à la sauvegarde (voir aussi PdfCache)
+        self.pdf_data = None
         self.generated_filename = None
+        self.pdf_cache = None
 
-        # Initialiser la police japonaise
-        self.setup_japanese_font()
+        # Tâche de fond en cours : les threads ne touchent jamais à Tk, ils
+        # envoient leurs messages dans self.events que la boucle Tk relève
+        self.events = queue.Queue()
+        self.job_thread = None
+        self.cancel_event = threading.Event()
+
+        self.font_available = False
+        self.selected_font_name = None
 
-        # Créer l'interface
+        # Créer l'interface : la fenêtre s'affiche sans attendre les polices
         self.create_interface()
 
+        # Initialiser la police japonaise
+        self.setup_japanese_font()
+
     def setup_japanese_font(self):
+        """Cherche la police japonaise en arrière-plan (voir fonts_discovered)"""
+        self.add_status("Recherche des polices japonaises...")
+        self.start_job(discover_fonts, on_done=self.fonts_discovered)
+
+    def fonts_discovered(self, result):
         """Configure la police japonaise depuis le dossier fonts/"""
+        available_fonts, (system_path, system_file) = result
         try:
-            # Utiliser resource_path pour obtenir le bon chemin
-            font_dir = resource_path("fonts")
-
-            print(f"Font directory: {font_dir}")
-            print(f"Font directory exists: {os.path.exists(font_dir)}")
-
-            available_fonts = []
-            if os.path.exists(font_dir):
-                files_in_dir = os.listdir(font_dir)
-                print(f"Files in fonts directory: {files_in_dir}")
-
-                for font_file in files_in_dir:
-                    if font_file.endswith(('.ttf', '.ttc')):  # Exclure .otf qui pose problème
-                        font_path = os.path.join(font_dir, font_file)
-                        print(f"Testing font: {font_path}")
-
-                        # Tester si la police peut être chargée
-                        try:
-                            # Test avec un nom temporaire
-                            test_name = f"TestFont_{len(available_fonts)}"
-                            pdfmetrics.registerFont(TTFont(test_name, font_path))
-                            available_fonts.append({
-                                'name': font_file,
-                                'path': font_path,
-                                'display_name': font_file.replace('.ttf', '').replace('.ttc', '')
-                            })
-                            print(f"Successfully tested font: {font_file}")
-                        except Exception as font_error:
-                            print(f"Failed to load {font_file}: {font_error}")
-                            continue
-
             font_found = None
             selected_font = None
-
-            if len(available_fonts) == 0:
-                print("No valid fonts found in fonts directory")
-                # Essayer les polices spécifiques que vous avez mentionnées
-                specific_fonts = ["SawarabiMincho-Regular.ttf", "NotoSansJP-VariableFont_wght.ttf"]
-                for font_name in specific_fonts:
-                    font_path = resource_path(os.path.join("fonts", font_name))
-                    if os.path.exists(font_path):
-                        try:
-                            test_name = f"TestFont_{len(available_fonts)}"
-                            pdfmetrics.registerFont(TTFont(test_name, font_path))
-                            available_fonts.append({
-                                'name': font_name,
-                                'path': font_path,
-                                'display_name': font_name.replace('.ttf', '')
-                            })
-                            print(f"Found specific font: {font_name}")
-                        except Exception as e:
-                            print(f"Failed to load specific font {font_name}: {e}")
-
-            if len(available_fonts) == 1:
+            settings = load_settings()
+            remembered = [font for font in available_fonts if font['path'] == settings.get("font_path")]
+
+            if remembered:
+                # Police choisie lors d'un lancement précédent : pas de question
+                selected_font = remembered[0]
+                log.debug("Remembered font: %s", selected_font['name'])
+            elif len(available_fonts) == 1:
                 # Une seule police, l'utiliser directement
                 selected_font = available_fonts[0]
-                print(f"Single font found: {selected_font['name']}")
+                log.debug("Single font found: %s", selected_font['name'])
             elif len(available_fonts) > 1:
                 # Plusieurs polices, demander à l'utilisateur de choisir
                 selected_font = self.show_font_selection_dialog(available_fonts)
+                # Fenêtre fermée sans choisir (None) : rien n'est mémorisé, police système sinon
+                if selected_font:
+                    settings["font_path"] = selected_font['path']
+                    save_settings(settings)
+                else:
+                    log.info("Font selection dialog closed without a choice")
 
             if selected_font:
-                try:
-                    pdfmetrics.registerFont(TTFont("JapaneseFont", selected_font['path']))
-                    font_found = selected_font['path']
-                    self.selected_font_name = selected_font['display_name']
-                    print(f"Successfully loaded selected font: {selected_font['name']}")
-                except Exception as font_error:
-                    print(f"Failed to load selected font: {font_error}")
-
-            # Si aucune police trouvée dans fonts/, chercher les polices système
-            if not font_found:
-                print("Searching system fonts...")
-                possible_fonts = [
-                    "NotoSansJP-VariableFont_wght.ttf",
-                    "NotoSansJP-Regular.ttf",
-                    "NotoSansCJK-Regular.ttc",
-                    "fonts-japanese-gothic.ttf"
-                ]
-
-                system_paths = [
-                    "/System/Library/Fonts/",
-                    "/usr/share/fonts/",
-                    "C:/Windows/Fonts/",
-                    os.path.expanduser("~/Library/Fonts/")
-                ]
-
-                for sys_path in system_paths:
-                    if os.path.exists(sys_path):
-                        for font_file in possible_fonts:
-                            full_path = os.path.join(sys_path, font_file)
-                            if os.path.exists(full_path):
-                                try:
-                                    pdfmetrics.registerFont(TTFont("JapaneseFont", full_path))
-                                    font_found = full_path
-                                    self.selected_font_name = font_file
-                                    print(f"Successfully loaded system font: {full_path}")
-                                    break
-                                except Exception as font_error:
-                                    print(f"Failed to load system font {full_path}: {font_error}")
-                                    continue
-                    if font_found:
-                        break
+                # La police est validée par le cache, elle ne sera chargée qu'au premier PDF
+                select_japanese_font(selected_font['path'])
+                font_found = selected_font['path']
+                self.selected_font_name = selected_font['display_name']
+                log.debug("Selected font: %s", selected_font['name'])
+
+            # Si aucune police trouvée dans fonts/, utiliser la police système
+            if not font_found and system_path:
+                select_japanese_font(system_path)
+                font_found = system_path
+                self.selected_font_name = system_file
 
             if font_found:
                 self.font_available = True
                 self.font_path = font_found
-                print(f"Final font selected: {font_found}")
+                log.info("Final font selected: %s", font_found)
+                # Charger la police tout de suite en arrière-plan pour que le premier PDF soit rapide
+                threading.Thread(target=preload_japanese_font, daemon=True).start()
             else:
                 self.font_available = False
                 self.selected_font_name = "Aucune"
-                print("No Japanese font could be loaded")
+                log.error("No Japanese font could be loaded")
 
         except Exception as e:
             self.font_available = False
             self.selected_font_name = "Erreur"
-            print(f"Error during font setup: {e}")
+            log.exception("Error during font setup: %s", e)
+
+        if not self.font_available:
+            self.add_status("⚠️ Aucune police japonaise trouvée. Vérifiez la console pour plus de détails.")
+        else:
+            self.add_status(f"✅ Police japonaise chargée: {self.selected_font_name}")
 
     def show_font_selection_dialog(self, available_fonts):
         """Affiche une popup pour choisir la police à utiliser"""
@@ -289,39 +3063,67 @@ class EnvelopeGenerator:
                                font=("Arial", 16, "bold"))
         title_label.grid(row=0, column=0, columnspan=2, pady=(0, 20))
 
+        # Recherche dans le carnet d'adresses : un clic sur un résultat remplit le formulaire
+        ttk.Label(main_frame, text="Rechercher dans le carnet:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(main_frame, textvariable=self.search_var, width=50)
+        search_entry.grid(row=1, column=1, sticky=(tk.W, tk.E), pady=5)
+        search_entry.bind("<Return>", lambda event: self.fill_from_book(0))
+        self.results_list = tk.Listbox(main_frame, height=6, activestyle="none")
+        self.results_list.grid(row=2, column=1, sticky=(tk.W, tk.E))
+        self.results_list.grid_remove()
+        self.results_list.bind("<<ListboxSelect>>", lambda event: self.fill_from_book())
+        self.address_book = None
+        self.search_results = []
+        self.search_job = None
+        self.search_var.trace_add("write", self.schedule_search)
+
         # Code postal
-        ttk.Label(main_frame, text="Code postal (ex: 〒160ｰ0007):").grid(row=1, column=0, sticky=tk.W, pady=5)
+        ttk.Label(main_frame, text="Code postal (ex: 〒160ｰ0007):").grid(row=3, column=0, sticky=tk.W, pady=5)
         self.postal_code_var = tk.StringVar(value="〒160ｰ0007")
         postal_entry = ttk.Entry(main_frame, textvariable=self.postal_code_var, width=20)
-        postal_entry.grid(row=1, column=1, sticky=(tk.W, tk.E), pady=5)
+        postal_entry.grid(row=3, column=1, sticky=(tk.W, tk.E), pady=5)
 
         # Adresse ligne 1
-        ttk.Label(main_frame, text="Adresse ligne 1:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        ttk.Label(main_frame, text="Adresse ligne 1:").grid(row=4, column=0, sticky=tk.W, pady=5)
         self.address1_var = tk.StringVar(value="東京都新宿区 荒木町11-1")
         address1_entry = ttk.Entry(main_frame, textvariable=self.address1_var, width=50)
-        address1_entry.grid(row=2, column=1, sticky=(tk.W, tk.E), pady=5)
+        address1_entry.grid(row=4, column=1, sticky=(tk.W, tk.E), pady=5)
 
         # Adresse ligne 2
-        ttk.Label(main_frame, text="Adresse ligne 2:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        ttk.Label(main_frame, text="Adresse ligne 2:").grid(row=5, column=0, sticky=tk.W, pady=5)
         self.address2_var = tk.StringVar(value="ハイム石川8号")
         address2_entry = ttk.Entry(main_frame, textvariable=self.address2_var, width=50)
-        address2_entry.grid(row=3, column=1, sticky=(tk.W, tk.E), pady=5)
+        address2_entry.grid(row=5, column=1, sticky=(tk.W, tk.E), pady=5)
 
         # Nom de l'entreprise
-        ttk.Label(main_frame, text="Nom de l'entreprise:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        ttk.Label(main_frame, text="Nom de l'entreprise:").grid(row=6, column=0, sticky=tk.W, pady=5)
         self.company_var = tk.StringVar(value="ステファン ビーディーシーLTD.")
         company_entry = ttk.Entry(main_frame, textvariable=self.company_var, width=50)
-        company_entry.grid(row=4, column=1, sticky=(tk.W, tk.E), pady=5)
+        company_entry.grid(row=6, column=1, sticky=(tk.W, tk.E), pady=5)
 
         # Destinataire
-        ttk.Label(main_frame, text="Destinataire:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        ttk.Label(main_frame, text="Destinataire:").grid(row=7, column=0, sticky=tk.W, pady=5)
         self.recipient_var = tk.StringVar(value="経理・藤原様")
         recipient_entry = ttk.Entry(main_frame, textvariable=self.recipient_var, width=50)
-        recipient_entry.grid(row=5, column=1, sticky=(tk.W, tk.E), pady=5)
+        recipient_entry.grid(row=7, column=1, sticky=(tk.W, tk.E), pady=5)
+
+        # Format d'enveloppe (mémorisé entre deux lancements)
+        ttk.Label(main_frame, text="Format:").grid(row=8, column=0, sticky=tk.W, pady=5)
+        templates = envelope_templates()
+        template = load_settings().get("template")
+        if template in templates:
+            select_template(template)
+        self.template_names = {spec.get("label", name): name for name, spec in templates.items()}
+        self.template_var = tk.StringVar(value=get_geometry().label)
+        template_box = ttk.Combobox(main_frame, textvariable=self.template_var, state="readonly",
+                                    values=list(self.template_names), width=30)
+        template_box.grid(row=8, column=1, sticky=tk.W, pady=5)
+        template_box.bind("<<ComboboxSelected>>", self.change_template)
 
         # Frame pour les boutons
         button_frame = ttk.Frame(main_frame)
-        button_frame.grid(row=6, column=0, columnspan=2, pady=20)
+        button_frame.grid(row=9, column=0, columnspan=2, pady=20)
 
         # Bouton vérifier avec style explicite
         verify_btn = tk.Button(button_frame, text="Vérifier l'adresse",
@@ -350,67 +3152,239 @@ class EnvelopeGenerator:
                                  relief="raised", bd=2,
                                  padx=10, pady=5)
 
+        # Bouton pour générer toutes les adresses d'un fichier CSV/JSONL
+        self.file_btn = tk.Button(button_frame, text="Depuis un fichier...",
+                                 command=self.generate_from_file,
+                                 bg="#6b6b6b", fg="grey",
+                                 font=("Arial", 10, "bold"),
+                                 relief="raised", bd=2,
+                                 padx=10, pady=5,
+                                 disabledforeground="gray")
+        self.file_btn.pack(side=tk.LEFT, padx=5)
+
+        # Bouton pour garder l'adresse saisie dans le carnet
+        book_btn = tk.Button(button_frame, text="Ajouter au carnet",
+                            command=self.save_to_book,
+                            bg="#6b6b6b", fg="grey",
+                            font=("Arial", 10, "bold"),
+                            relief="raised", bd=2,
+                            padx=10, pady=5)
+        book_btn.pack(side=tk.LEFT, padx=5)
+        self.verify_btn = verify_btn
+
+        # Progression des tâches longues et annulation
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.grid(row=11, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        progress_frame.columnconfigure(0, weight=1)
+        self.progress = ttk.Progressbar(progress_frame, mode="determinate")
+        self.progress.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 5))
+        self.cancel_btn = tk.Button(progress_frame, text="Annuler",
+                                   command=self.cancel_job, state="disabled",
+                                   bg="#6b6b6b", fg="grey",
+                                   font=("Arial", 10),
+                                   disabledforeground="gray")
+        self.cancel_btn.grid(row=0, column=1)
+
         # Zone d'état
         self.status_text = tk.Text(main_frame, height=8, width=70)
-        self.status_text.grid(row=7, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
+        self.status_text.grid(row=10, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
 
         # Scrollbar pour la zone d'état
         scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=self.status_text.yview)
-        scrollbar.grid(row=7, column=2, sticky=(tk.N, tk.S))
+        scrollbar.grid(row=10, column=2, sticky=(tk.N, tk.S))
         self.status_text.configure(yscrollcommand=scrollbar.set)
 
+        # Aperçu à droite du formulaire, mis à jour pendant la saisie
+        self.preview = EnvelopePreview(main_frame)
+        self.preview.canvas.grid(row=0, column=3, rowspan=12, padx=(15, 0), sticky=tk.N)
+        self.preview_job = None
+        for var in (self.postal_code_var, self.address1_var, self.address2_var,
+                    self.company_var, self.recipient_var):
+            var.trace_add("write", self.schedule_preview)
+        self.update_preview()
+
+        self.address_valid = False
+        self.root.after(50, self.poll_events)
+
         # Message initial
         self.add_status("Interface initialisée.")
-        if not self.font_available:
-            self.add_status("⚠️ Aucune police japonaise trouvée. Vérifiez la console pour plus de détails.")
+
+    def open_book(self):
+        """Carnet d'adresses, ouvert à la première recherche ; None s'il est inaccessible"""
+        if self.address_book is None:
+            try:
+                self.address_book = AddressBook()
+            except Exception as e:
+                log.warning("Could not open address book: %s", e)
+                self.add_status(f"❌ Carnet d'adresses inaccessible: {e}")
+        return self.address_book
+
+    def schedule_search(self, *args):
+        """Cherche dans le carnet 100 ms après la dernière frappe"""
+        if self.search_job:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(100, self.search_book)
+
+    def search_book(self):
+        self.search_job = None
+        query = self.search_var.get()
+        book = self.open_book() if query.strip() else None
+        self.search_results = book.search(query, limit=8) if book else []
+        self.results_list.delete(0, tk.END)
+        for _, record in self.search_results:
+            self.results_list.insert(tk.END, " ".join(filter(None, (
+                record["company"], record["recipient"], "-", record["address1"]))))
+        if self.search_results:
+            self.results_list.grid()
         else:
-            self.add_status(f"✅ Police japonaise chargée: {self.selected_font_name}")
+            self.results_list.grid_remove()
+
+    def fill_from_book(self, index=None):
+        """Remplit le formulaire avec un résultat de recherche (par défaut celui sélectionné)"""
+        if index is None:
+            selection = self.results_list.curselection()
+            index = selection[0] if selection else None
+        if index is None or index >= len(self.search_results):
+            return
+        _, record = self.search_results[index]
+        for var, field in ((self.postal_code_var, "postal_code"), (self.address1_var, "address1"),
+                           (self.address2_var, "address2"), (self.company_var, "company"),
+                           (self.recipient_var, "recipient")):
+            var.set(record[field])
+        self.results_list.grid_remove()
+        self.add_status(f"Adresse du carnet : {record['company']} {record['recipient']}")
+
+    def save_to_book(self):
+        """Ajoute l'adresse saisie au carnet"""
+        book = self.open_book()
+        if book is None:
+            return
+        record = self.current_record()
+        if not (record["address1"].strip() and (record["company"].strip() or record["recipient"].strip())):
+            messagebox.showerror("Erreur", "Adresse incomplète : rien n'a été ajouté au carnet")
+            return
+        book.add(record)
+        self.add_status(f"✅ Adresse ajoutée au carnet ({len(book)} adresses)")
+
+    def change_template(self, event=None):
+        """Nouveau format d'enveloppe : aperçu redessiné, choix mémorisé"""
+        name = self.template_names[self.template_var.get()]
+        select_template(name)
+        settings = load_settings()
+        settings["template"] = name
+        save_settings(settings)
+        self.update_preview()
+        self.add_status(f"Format: {get_geometry().label}")
+
+    def schedule_preview(self, *args):
+        """Redessine l'aperçu 150 ms après la dernière frappe"""
+        if self.preview_job:
+            self.root.after_cancel(self.preview_job)
+        self.preview_job = self.root.after(150, self.update_preview)
+
+    def update_preview(self):
+        self.preview_job = None
+        record = self.current_record()
+        # Chasses approchées tant que la police n'est pas prête (voir preload_japanese_font)
+        font_path = _selected_font_path if has_advances(_selected_font_path) else None
+        self.preview.show(cached_layout(tuple(record[field] for field in ADDRESS_FIELDS), font_path,
+                                        _selected_template))
 
     def add_status(self, message):
-        """Ajoute un message dans la zone d'état"""
+        """Ajoute un message dans la zone d'état (thread Tk uniquement, voir post_status)"""
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
         self.status_text.insert(tk.END, f"[{timestamp}] {message}\n")
         self.status_text.see(tk.END)
-        self.root.update()
 
-    def verify_address(self):
-        """Vérifie la validité de l'adresse saisie"""
-        self.add_status("Vérification de l'adresse...")
+    def post_status(self, message):
+        """Ajoute un message dans la zone d'état depuis n'importe quel thread"""
+        self.events.put(("status", message))
+
+    def start_job(self, target, *args, on_done=None, cancellable=False):
+        """Exécute target(*args) dans un thread ; on_done(résultat) est appelé dans le thread Tk"""
+        if self.job_thread and self.job_thread.is_alive():
+            self.add_status("⏳ Une tâche est déjà en cours")
+            return False
+        self.cancel_event = threading.Event()
+        self.set_busy(True, cancellable)
+        self.job_thread = threading.Thread(target=self._run_job, args=(target, args, on_done), daemon=True)
+        self.job_thread.start()
+        return True
+
+    def _run_job(self, target, args, on_done):
+        try:
+            self.events.put(("done", on_done, target(*args)))
+        except RenderCancelled as e:
+            self.events.put(("cancelled", str(e)))
+        except Exception as e:
+            log.exception("Background job failed")
+            self.events.put(("error", e))
 
-        # Récupérer les valeurs
-        postal = self.postal_code_var.get().strip()
-        addr1 = self.address1_var.get().strip()
-        addr2 = self.address2_var.get().strip()
-        company = self.company_var.get().strip()
-        recipient = self.recipient_var.get().strip()
+    def poll_events(self):
+        """Relève les messages des tâches de fond (appelé toutes les 50 ms par after)"""
+        try:
+            while True:
+                event = self.events.get_nowait()
+                kind = event[0]
+                if kind == "status":
+                    self.add_status(event[1])
+                elif kind == "progress":
+                    done, total = event[1], event[2]
+                    self.progress.configure(maximum=max(total, 1), value=done)
+                elif kind == "done":
+                    self.set_busy(False)
+                    if event[1]:
+                        event[1](event[2])
+                elif kind == "cancelled":
+                    self.set_busy(False)
+                    self.add_status(f"⏹️ {event[1]}")
+                elif kind == "error":
+                    self.set_busy(False)
+                    self.add_status(f"❌ Erreur: {event[1]}")
+                    messagebox.showerror("Erreur", f"L'opération a échoué:\n{event[1]}")
+        except queue.Empty:
+            pass
+        self.root.after(50, self.poll_events)
+
+    def set_busy(self, busy, cancellable=False):
+        """Désactive les boutons pendant une tâche de fond"""
+        state = "disabled" if busy else "normal"
+        self.verify_btn.configure(state=state)
+        self.file_btn.configure(state=state)
+        self.save_btn.configure(state=state)
+        if busy:
+            self.generate_btn.configure(state="disabled")
+            self.progress.configure(value=0)
+        elif self.address_valid:
+            self.generate_btn.configure(state="normal")
+        self.cancel_btn.configure(state="normal" if busy and cancellable else "disabled")
 
-        errors = []
-        warnings = []
+    def cancel_job(self):
+        self.cancel_event.set()
+        self.add_status("Annulation demandée...")
 
-        # Vérifications
-        if not postal:
-            errors.append("Le code postal est obligatoire")
-        elif not postal.startswith('〒'):
-            warnings.append("Le code postal devrait commencer par 〒")
+    def verify_address(self):
+        """Vérifie la validité de l'adresse saisie"""
+        self.add_status("Vérification de l'adresse...")
 
-        if not addr1:
-            errors.append("L'adresse ligne 1 est obligatoire")
-        elif len(addr1) > 40:
-            warnings.append(f"Adresse ligne 1 très longue ({len(addr1)} caractères)")
+        record = self.current_record()
 
-        if not company:
-            errors.append("Le nom de l'entreprise est obligatoire")
+        def check():
+            # L'index des codes postaux est ouvert dans le thread, pas dans la boucle Tk
+            errors, warnings = validate_address(record, get_postal_index())
+            missing = coverage_report([record])["missing"]
+            if missing:
+                warnings.append(f"caractères absents de toutes les polices (cases vides): {''.join(missing)}")
+            return errors, warnings
 
-        if not recipient:
-            errors.append("Le destinataire est obligatoire")
+        self.start_job(check, on_done=self.show_validation)
 
-        # Vérifier la longueur totale pour chaque ligne
-        lines = [addr1, addr2, company, recipient]
-        for i, line in enumerate(lines, 1):
-            if len(line) > 35:
-                warnings.append(f"Ligne {i} risque de déborder ({len(line)} caractères)")
+    def show_validation(self, result):
+        """Affiche le résultat de validate_address"""
+        errors, warnings = result
 
         # Afficher les résultats
+        self.address_valid = not errors
         if errors:
             for error in errors:
                 self.add_status(f"❌ Erreur: {error}")
@@ -430,122 +3404,80 @@ class EnvelopeGenerator:
 
         self.add_status("Génération du PDF en cours...")
 
-        try:
-            # Créer un nom de fichier avec timestamp et portion d'adresse
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            company_clean = re.sub(r'[^a-zA-Z0-9\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF]', '',
-                                 self.company_var.get())[:10]
-            self.generated_filename = f"envelope_{timestamp}_{company_clean}.pdf"
-
-            # Créer un fichier temporaire
-            temp_dir = tempfile.gettempdir()
-            self.pdf_temp_path = os.path.join(temp_dir, self.generated_filename)
-
-            # Générer le PDF
-            self.create_pdf(self.pdf_temp_path)
-
-            self.add_status(f"✅ PDF généré: {self.generated_filename}")
+        # Créer un nom de fichier avec timestamp et portion d'adresse
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        company_clean = re.sub(r'[^a-zA-Z0-9\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF]', '',
+                             self.company_var.get())[:10]
+        filename = f"envelope_{timestamp}_{company_clean}.pdf"
+
+        # Générer le PDF dans un thread (chargement de la police et c.save() compris),
+        # ou le reprendre du cache si cette adresse a déjà été générée
+        self.start_job(self.render_cached, self.current_record(),
+                       on_done=lambda result: self.pdf_generated(result, filename))
+
+    def render_cached(self, record):
+        """Tâche de fond de generate_pdf"""
+        if self.pdf_cache is None:
+            self.pdf_cache = PdfCache()
+        return self.pdf_cache.fetch(record)
+
+    def pdf_generated(self, result, filename):
+        self.pdf_data, from_cache = result
+        self.generated_filename = filename
+        source = " (depuis le cache)" if from_cache else ""
+        self.add_status(f"✅ PDF généré{source}: {self.generated_filename}")
+
+        # Afficher le bouton de sauvegarde
+        self.save_btn.pack(side=tk.LEFT, padx=5)
+
+    def generate_from_file(self):
+        """Génère un PDF avec toutes les adresses d'un fichier CSV/JSONL"""
+        if not self.font_available:
+            messagebox.showerror("Erreur", "Aucune police japonaise disponible")
+            return
 
-            # Afficher le bouton de sauvegarde
-            self.save_btn.pack(side=tk.LEFT, padx=5)
+        input_path = filedialog.askopenfilename(
+            filetypes=[("Destinataires", "*.csv *.jsonl"), ("All files", "*.*")])
+        if not input_path:
+            return
+        output_path = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")],
+            initialfile=os.path.splitext(os.path.basename(input_path))[0] + ".pdf")
+        if not output_path:
+            return
 
-        except Exception as e:
-            self.add_status(f"❌ Erreur lors de la génération: {str(e)}")
-            messagebox.showerror("Erreur", f"Impossible de générer le PDF:\n{str(e)}")
+        self.add_status(f"Génération depuis {os.path.basename(input_path)}...")
+        self.start_job(self._render_file, input_path, output_path, cancellable=True,
+                       on_done=lambda result: self.add_status(
+                           f"✅ {result[0]} enveloppes -> {output_path} en {result[1]:.1f} s"))
+
+    def _render_file(self, input_path, output_path):
+        """Tâche de fond de generate_from_file"""
+        records = list(read_recipients(input_path))
+        total = len(records)
+        self.post_status(f"{total} adresses à générer")
+        report = lambda done: self.events.put(("progress", done, total))
+        return render_batch(records, output_path, progress_every=25,
+                            progress=report, cancel_event=self.cancel_event)
+
+    def current_record(self):
+        """Retourne l'adresse saisie dans le formulaire"""
+        return {
+            "postal_code": self.postal_code_var.get(),
+            "address1": self.address1_var.get(),
+            "address2": self.address2_var.get(),
+            "company": self.company_var.get(),
+            "recipient": self.recipient_var.get(),
+        }
 
     def create_pdf(self, filepath):
-            """Crée le PDF avec l'adresse saisie (décalage code postal)"""
-            c = canvas.Canvas(filepath, pagesize=A5)
-            page_width, page_height = A5
-
-            lines = []
-            if self.address1_var.get().strip(): lines.append(self.address1_var.get().strip())
-            if self.address2_var.get().strip(): lines.append(self.address2_var.get().strip())
-            if self.company_var.get().strip(): lines.append(self.company_var.get().strip())
-            if self.recipient_var.get().strip(): lines.append(self.recipient_var.get().strip())
-
-            postal_code = self.postal_code_var.get().strip()
-        
-            max_line_length = max(len(line) for line in lines) if lines else 0
-            if max_line_length <= 16: font_size, char_spacing = 14, 20
-            elif max_line_length <= 20: font_size, char_spacing = 12, 18
-            elif max_line_length <= 24: font_size, char_spacing = 10, 15
-            elif max_line_length <= 28: font_size, char_spacing = 9, 13
-            else: font_size, char_spacing = 8, 11
-            c.setFont("JapaneseFont", font_size)
-
-            x_start = page_width - 40 * mm
-            y_start_offset_from_postal = 9 * mm
-            line_spacing = 12 * mm
-
-            case_width, case_height, spacing = 8 * mm, 10 * mm, 1 * mm
-        
-            total_postal_block_width = (8 * case_width) + (7 * spacing)
-        
-            ### MODIFICATION ICI ###
-            # Calcul du décalage vers la droite (équivalent à la largeur de 2 cases)
-            shift_offset = 2 * (case_width + spacing)
-            # La position est maintenant : centrée + le décalage
-            postal_x = (page_width - total_postal_block_width) / 2 + shift_offset
-        
-            postal_y = page_height - 25 * mm
-
-            y_start = postal_y - y_start_offset_from_postal
-
-            # Le reste de la fonction pour dessiner les éléments reste identique...
-            for i in range(8):
-                current_x = postal_x + i * (case_width + spacing)
-                if i == 3:
-                    c.setStrokeColorRGB(0.8, 0, 0)
-                    c.setLineWidth(1.5)
-                    dash_width = case_width / 5
-                    dash_x_start = current_x + (case_width - dash_width) / 2
-                    dash_y = postal_y + case_height / 2
-                    c.line(dash_x_start, dash_y, dash_x_start + dash_width, dash_y)
-                else:
-                    c.setStrokeColorRGB(0.8, 0, 0)
-                    c.setLineWidth(2 if i < 3 else 1)
-                    c.setFillColorRGB(1, 1, 1)
-                    c.rect(current_x, postal_y, case_width, case_height, stroke=1, fill=1)
-
-            c.setFillColorRGB(0, 0, 0)
-            c.setFont("JapaneseFont", 12)
-            postal_digits = postal_code.replace('〒', '').replace('ｰ', '').replace('-', '')
-            digit_index = 0
-
-            for i in range(8):
-                if i != 3 and digit_index < len(postal_digits):
-                    current_x = postal_x + i * (case_width + spacing)
-                    char = postal_digits[digit_index]
-                    char_width = c.stringWidth(char, "JapaneseFont", 12)
-                    text_x = current_x + (case_width - char_width) / 2
-                    text_y = postal_y + 2 * mm
-                    c.drawString(text_x, text_y, char)
-                    digit_index += 1
-
-            c.setFont("JapaneseFont", font_size)
-
-            margin_bottom = 10 * mm
-            indent_offset = 6 * mm
-        
-            for i, line in enumerate(lines):
-                x = x_start - (i * line_spacing)
-                y = y_start - (i * indent_offset)
-
-                if i == 3:
-                    additional_vertical_offset = 6 * char_spacing
-                    y -= additional_vertical_offset
-
-                for j, char in enumerate(line):
-                    current_y = y - (j * char_spacing)
-                    if current_y < margin_bottom: break
-                    c.drawString(x, current_y, char)
-
-            c.save()
+        """Crée le PDF avec l'adresse saisie (décalage code postal)"""
+        create_pdf(filepath, self.current_record())
 
     def save_pdf(self):
         """Permet à l'utilisateur de sauvegarder le PDF"""
-        if not self.pdf_temp_path or not os.path.exists(self.pdf_temp_path):
+        if not self.pdf_data:
             messagebox.showerror("Erreur", "Aucun PDF à sauvegarder")
             return
 
@@ -558,7 +3490,9 @@ class EnvelopeGenerator:
 
         if save_path:
             try:
-                shutil.copy2(self.pdf_temp_path, save_path)
+                with STATS.timer("write"):
+                    with open(save_path, "wb") as f:
+                        f.write(self.pdf_data)
                 self.add_status(f"✅ PDF sauvegardé: {save_path}")
                 messagebox.showinfo("Succès", f"PDF sauvegardé avec succès:\n{save_path}")
             except Exception as e:
@@ -569,14 +3503,412 @@ class EnvelopeGenerator:
         """Lance l'application"""
         self.root.mainloop()
 
-        # Nettoyer le fichier temporaire à la fermeture
-        if self.pdf_temp_path and os.path.exists(self.pdf_temp_path):
-            try:
-                os.remove(self.pdf_temp_path)
-            except:
-                pass
+        if self.pdf_cache:
+            log.info("PDF cache: %s", self.pdf_cache.stats())
 
-if __name__ == "__main__":
+def run_gui(args):
+    """Sous-commande "gui" (aussi utilisée sans argument) : lance l'interface graphique"""
+    if tk is None:
+        log.error("tkinter n'est pas disponible : seules les sous-commandes sans interface fonctionnent")
+        return 1
     app = EnvelopeGenerator()
     app.run()
+    return 0
+
+def run_batch(args):
+    """Sous-commande "batch" : rend un fichier de destinataires sans interface"""
+    font_path = setup_font_headless(args.font)
+    if not font_path:
+        log.error("Aucune police japonaise trouvée")
+        return 1
+
+    # "-o -" : le PDF ou l'archive est écrit sur la sortie standard (tube vers le serveur d'impression)
+    to_stdout = args.output == "-"
+    zip_output = args.zip or (not to_stdout and args.output.lower().endswith(".zip"))
+    if (to_stdout or zip_output) and (args.per_envelope or args.split or args.workers != 1):
+        log.error("La sortie standard et --zip ne fonctionnent qu'avec un seul processus, "
+                  "sans --split ni --per-envelope")
+        return 1
+    if args.sheet and (zip_output or args.per_envelope or args.split or args.workers != 1):
+        log.error("--sheet ne fonctionne qu'avec un seul processus et un seul PDF")
+        return 1
+    volumes = args.volume_pages or args.volume_mb or args.resume
+    if volumes and (to_stdout or zip_output or args.per_envelope or args.split or args.sheet
+                    or args.workers != 1):
+        log.error("--volume-pages, --volume-mb et --resume ne fonctionnent qu'avec un seul processus "
+                  "et un fichier PDF en sortie")
+        return 1
+    report = sys.stderr if to_stdout else sys.stdout
+    output = sys.stdout.buffer if to_stdout else args.output
+
+    records = read_recipients(args.input, args.format)
+    if args.skip_invalid or args.report:
+        # Vérification de tout le fichier avant de commencer le rendu
+        records = list(records)
+        issues = list(validate_records(records, get_postal_index()))
+        if args.report:
+            write_validation_report(args.report, issues)
+        if args.skip_invalid:
+            rejected = {position for position, _, errors, _ in issues if errors}
+            if rejected:
+                records = [record for position, record in enumerate(records) if position not in rejected]
+                print(f"{len(rejected)} adresses invalides écartées", file=report)
+    presort = None
+    if args.presort:
+        presort = {}
+        records = presort_records(records, args.prefix_length, report=presort)
+    if args.check_glyphs:
+        records = list(records)
+        with STATS.timer("coverage_check"):
+            coverage = coverage_report(records)
+        print(f"Glyphes: {describe_coverage(coverage)}", file=report)
+        if coverage["missing"]:
+            log.warning("Caractères sans glyphe dans aucune police (cases vides): %s",
+                        "".join(coverage["missing"]))
+    if args.workers == 0:
+        args.workers = os.cpu_count()
+    if zip_output:
+        count, elapsed = render_zip(records, output)
+        outputs = [args.output]
+    elif args.per_envelope:
+        max_bytes = args.cache_size * 1024 * 1024 if args.cache_size is not None else None
+        cache = PdfCache(max_bytes=max_bytes)
+        count, elapsed = render_each(records, args.output, cache)
+        outputs = [args.output]
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} réutilisés, {stats['misses']} générés "
+              f"({stats['hit_rate']:.0%}), {stats['evictions']} supprimés, "
+              f"{stats['bytes'] / 1024 / 1024:.1f}/{stats['max_bytes'] / 1024 / 1024:.0f} Mo")
+    elif args.sheet:
+        count, pages, elapsed = render_sheets(records, output, args.sheet)
+        outputs = [args.output]
+        print(f"{pages} feuilles {args.sheet} ({len(sheet_slots(args.sheet))} enveloppes par feuille)", file=report)
+    elif volumes:
+        st = os.stat(args.input)
+        source = {"input": os.path.abspath(args.input), "size": st.st_size, "mtime": st.st_mtime,
+                  "skip_invalid": args.skip_invalid, "presort": args.presort and args.prefix_length}
+
+        def show_volume(volume):
+            rss = f", pic mémoire {volume['peak_rss_kb'] / 1024:.1f} Mo" if volume["peak_rss_kb"] else ""
+            print(f"{volume['path']}: {volume['count']} enveloppes, "
+                  f"{volume['bytes'] / 1024 / 1024:.1f} Mo{rss}", file=report, flush=True)
+
+        try:
+            count, elapsed, done = render_volumes(records, args.output, args.volume_pages, args.volume_mb,
+                                                  resume=args.resume, source=source, progress=show_volume)
+        except ValueError as e:
+            log.error("%s", e)
+            return 1
+        outputs = [volume["path"] for volume in done] or [args.output]
+    elif args.workers == 1 and not args.split:
+        count, elapsed = render_batch(records, output)
+        outputs = [args.output]
+    else:
+        count, elapsed, outputs = render_parallel(records, args.output, font_path,
+                                                  workers=args.workers,
+                                                  shard_size=args.shard_size,
+                                                  split=args.split)
+    rate = count / elapsed if elapsed > 0 else 0.0
+    if to_stdout:
+        target = "la sortie standard"
+    else:
+        target = args.output if len(outputs) == 1 else f"{len(outputs)} fichiers ({outputs[0]} ...)"
+    print(f"{count} enveloppes -> {target} en {elapsed:.2f} s ({rate:.1f} env/s)", file=report)
+    if presort is not None:
+        show_presort(presort, args.groups, report)
+    return 0
+
+def show_presort(presort, groups_path=None, output=None):
+    """Résumé de presort_records, et nombre d'adresses par groupe (dans groups_path, sinon affiché)"""
+    output = output or sys.stdout
+    groups = presort["groups"]
+    print(f"Tri postal: {presort['read']} adresses lues, {presort['duplicates']} doublons écartés, "
+          f"{len(groups)} groupes ({presort['runs']} paquets triés)", file=output)
+    if groups_path:
+        with open(groups_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["prefix", "count"])
+            writer.writerows(groups.items())
+    else:
+        for prefix, count in groups.items():
+            print(f"  {prefix or 'code invalide'}: {count}", file=output)
+
+def run_presort(args):
+    """Sous-commande "presort" : trie un fichier par code postal et retire les doublons"""
+    start = time.perf_counter()
+    presort = {}
+    records = presort_records(read_recipients(args.input, args.format), args.prefix_length,
+                              chunk_size=args.chunk_size, report=presort)
+    count = write_recipients(args.output, records, args.output_format)
+    elapsed = time.perf_counter() - start
+    rate = presort["read"] / elapsed if elapsed > 0 else 0.0
+    print(f"{count} adresses -> {args.output} en {elapsed:.2f} s ({rate:.0f} adresses/s)")
+    show_presort(presort, args.groups)
+    return 0
+
+def run_cache(args):
+    """Sous-commande "cache" : état ou vidage du cache des PDF"""
+    cache = PdfCache()
+    if args.action == "clear":
+        cache.clear()
+        print(f"Cache vidé: {cache.directory}")
+        return 0
+    stats = cache.stats()
+    print(f"{cache.directory}: {stats['entries']} PDF, "
+          f"{stats['bytes'] / 1024 / 1024:.1f}/{stats['max_bytes'] / 1024 / 1024:.0f} Mo")
+    return 0
+
+def run_serve(args):
+    """Sous-commande "serve" : service HTTP local de rendu (voir RenderService)"""
+    import asyncio
+    font_path = setup_font_headless(args.font)
+    if not font_path:
+        log.error("Aucune police japonaise trouvée")
+        return 1
+    service = RenderService(font_path, workers=args.workers or None, queue_size=args.queue_size)
+    service.start_workers()
+    ready = lambda address: print(f"Service de rendu sur http://{address[0]}:{address[1]} "
+                                  f"({service.workers} workers, file de {service.queue_size})", flush=True)
+    try:
+        asyncio.run(service.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+def run_book(args):
+    """Sous-commande "book" : import, recherche et état du carnet d'adresses"""
+    with AddressBook(args.book) as book:
+        if args.action == "import":
+            if not args.arguments:
+                log.error("Fichier à importer manquant")
+                return 1
+            start = time.perf_counter()
+            before = len(book)
+            for path in args.arguments:
+                book.import_records(read_recipients(path, args.format, fields=BOOK_FIELDS))
+            print(f"{len(book) - before} adresses importées dans {book.path} "
+                  f"en {time.perf_counter() - start:.2f} s")
+        elif args.action == "search":
+            start = time.perf_counter()
+            results = book.search(" ".join(args.arguments), limit=args.limit, scan=None)
+            elapsed = time.perf_counter() - start
+            for contact_id, record in results:
+                print(f"{contact_id}: {record['postal_code']} {record['address1']} {record['address2']} / "
+                      f"{record['company']} / {record['recipient']}")
+            print(f"{len(results)} résultats en {elapsed * 1000:.1f} ms", file=sys.stderr)
+        else:
+            print(f"{book.path}: {len(book)} adresses")
+    return 0
+
+def run_postal_index(args):
+    """Sous-commande "postal-index" : compile KEN_ALL.CSV en index binaire"""
+    start = time.perf_counter()
+    path, count = build_postal_index(args.csv, args.output, args.encoding)
+    print(f"{count} codes postaux -> {path} ({os.path.getsize(path) / 1024:.0f} ko) "
+          f"en {time.perf_counter() - start:.2f} s")
+    return 0
+
+def run_validate(args):
+    """Sous-commande "validate" : vérifie toutes les adresses d'un fichier"""
+    index = PostalIndex(args.postal_index) if args.postal_index else get_postal_index()
+    if index is None:
+        log.warning("Pas d'index des codes postaux (voir la sous-commande postal-index)")
+    start = time.perf_counter()
+    records = list(read_recipients(args.input, args.format))
+    issues = validate_records(records, index)
+    if args.report:
+        invalid, warned = write_validation_report(args.report, issues)
+        print(f"{len(records)} adresses, {invalid} invalides, {warned} avec avertissements "
+              f"-> {args.report} en {time.perf_counter() - start:.2f} s")
+        return 1 if invalid else 0
+
+    invalid = 0
+    for position, _, errors, warnings in issues:
+        for error in errors:
+            print(f"{position + 1}: ❌ {error}")
+        for warning in warnings:
+            print(f"{position + 1}: ⚠️ {warning}")
+        if errors:
+            invalid += 1
+    print(f"{len(records)} adresses, {invalid} invalides")
+    return 1 if invalid else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="envejp",
+        description="Générateur d'enveloppes japonaises. Sans argument, lance l'interface graphique.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    # Options communes à toutes les sous-commandes
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--log-level", default="warning",
+                        choices=["debug", "info", "warning", "error"],
+                        help="Niveau des messages sur la console (défaut: warning)")
+    common.add_argument("--stats", metavar="FICHIER",
+                        help="Écrit les durées et compteurs par étape dans un fichier JSON")
+    common.add_argument("--profile", metavar="FICHIER",
+                        help="Écrit un profil cProfile (lisible avec pstats ou snakeviz)")
+
+    # Format d'enveloppe, pour les sous-commandes qui dessinent
+    layout = argparse.ArgumentParser(add_help=False)
+    layout.add_argument("--template", metavar="FORMAT",
+                        help="Format d'enveloppe : %s, ou un format de --templates (défaut: %s)"
+                        % (", ".join(ENVELOPE_TEMPLATES), DEFAULT_TEMPLATE))
+    layout.add_argument("--templates", metavar="FICHIER",
+                        help=f"Formats personnalisés en JSON (en plus de {templates_path()})")
+    layout.add_argument("--fallback-font", action="append", metavar="FICHIER",
+                        help="Police de secours pour les caractères absents de la police principale "
+                        "(répétable, dans l'ordre ; défaut: fallback_fonts de settings.json, "
+                        "sinon les polices CJK du système)")
+
+    gui = subparsers.add_parser("gui", parents=[common, layout], help="Lance l'interface graphique")
+    gui.set_defaults(func=run_gui)
+
+    batch = subparsers.add_parser("batch", parents=[common, layout],
+                                  help="Rend un fichier CSV/JSONL de destinataires dans un PDF")
+    batch.add_argument("input", help="Fichier CSV ou JSONL (colonnes: %s), ou carnet d'adresses .db"
+                       % ", ".join(ADDRESS_FIELDS))
+    batch.add_argument("-o", "--output", required=True,
+                       help="PDF de sortie (une page par enveloppe), archive .zip, ou - pour la sortie standard")
+    batch.add_argument("--format", choices=["csv", "jsonl", "book"], help="Format d'entrée (déduit de l'extension par défaut)")
+    batch.add_argument("--font", help="Fichier .ttf/.ttc à utiliser à la place de fonts/")
+    batch.add_argument("--workers", type=int, default=1,
+                       help="Nombre de processus de rendu (0 = nombre de cœurs, défaut: 1)")
+    batch.add_argument("--shard-size", type=int, default=500,
+                       help="Nombre d'enveloppes par lot envoyé à un worker (défaut: 500)")
+    batch.add_argument("--split", action="store_true",
+                       help="Écrire un fichier numéroté par lot au lieu de les fusionner")
+    batch.add_argument("--per-envelope", action="store_true",
+                       help="Un PDF par enveloppe dans le dossier -o, repris du cache des PDF si possible")
+    batch.add_argument("--zip", action="store_true",
+                       help="Archive ZIP d'un PDF par enveloppe (implicite si -o finit par .zip)")
+    batch.add_argument("--sheet", choices=list(SHEET_TEMPLATES),
+                       help="Plusieurs enveloppes par page : %s" % ", ".join(
+                           f"{name} = {sheet['label']}" for name, sheet in SHEET_TEMPLATES.items()))
+    batch.add_argument("--cache-size", type=int, metavar="MO",
+                       help=f"Taille maximale du cache des PDF (défaut: {PdfCache.DEFAULT_MAX_MB} Mo)")
+    batch.add_argument("--skip-invalid", action="store_true",
+                       help="Vérifie tout le fichier avant le rendu et écarte les adresses en erreur")
+    batch.add_argument("--report", metavar="FICHIER",
+                       help="Rapport de vérification des adresses (.csv ou .json)")
+    batch.add_argument("--volume-pages", type=int, metavar="N",
+                       help="Découpe le PDF en volumes de N pages (envoi_0001.pdf...), "
+                       "avec un manifeste de reprise envoi.manifest.json")
+    batch.add_argument("--volume-mb", type=float, metavar="MO",
+                       help="Découpe le PDF en volumes d'environ MO Mo (comme --volume-pages)")
+    batch.add_argument("--resume", action="store_true",
+                       help="Reprend un envoi en volumes interrompu d'après son manifeste")
+    batch.add_argument("--presort", action="store_true",
+                       help="Trie par code postal et retire les doublons avant le rendu (区分郵便)")
+    batch.add_argument("--prefix-length", type=int, default=PRESORT_PREFIX,
+                       help=f"Chiffres du code postal par groupe avec --presort (défaut: {PRESORT_PREFIX})")
+    batch.add_argument("--groups", metavar="FICHIER",
+                       help="Avec --presort, écrit le nombre d'adresses par groupe dans un CSV")
+    batch.add_argument("--check-glyphs", action="store_true",
+                       help="Vérifie avant le rendu que chaque caractère a un glyphe (police principale ou de secours)")
+    batch.set_defaults(func=run_batch)
+
+    validate = subparsers.add_parser("validate", parents=[common],
+                                     help="Vérifie les adresses d'un fichier CSV/JSONL sans rien générer")
+    validate.add_argument("input", help="Fichier CSV ou JSONL, ou carnet d'adresses .db")
+    validate.add_argument("--format", choices=["csv", "jsonl", "book"], help="Format d'entrée (déduit de l'extension par défaut)")
+    validate.add_argument("--postal-index", help="Index des codes postaux (défaut: celui du cache)")
+    validate.add_argument("--report", metavar="FICHIER",
+                          help="Écrit les adresses signalées dans un rapport .csv ou .json au lieu de les afficher")
+    validate.set_defaults(func=run_validate)
+
+    presort = subparsers.add_parser("presort", parents=[common],
+                                    help="Trie un fichier par code postal et retire les doublons (区分郵便)")
+    presort.add_argument("input", help="Fichier CSV ou JSONL, ou carnet d'adresses .db")
+    presort.add_argument("-o", "--output", required=True, help="Fichier trié (.csv ou .jsonl)")
+    presort.add_argument("--format", choices=["csv", "jsonl", "book"], help="Format d'entrée (déduit de l'extension par défaut)")
+    presort.add_argument("--output-format", choices=["csv", "jsonl"], help="Format de sortie (déduit de l'extension par défaut)")
+    presort.add_argument("--prefix-length", type=int, default=PRESORT_PREFIX,
+                         help=f"Chiffres du code postal par groupe (défaut: {PRESORT_PREFIX})")
+    presort.add_argument("--chunk-size", type=int, default=PRESORT_CHUNK,
+                         help=f"Adresses triées en mémoire à la fois (défaut: {PRESORT_CHUNK})")
+    presort.add_argument("--groups", metavar="FICHIER", help="Écrit le nombre d'adresses par groupe dans un CSV")
+    presort.set_defaults(func=run_presort)
+
+    cache = subparsers.add_parser("cache", parents=[common], help="État ou vidage du cache des PDF")
+    cache.add_argument("action", choices=["stats", "clear"], nargs="?", default="stats")
+    cache.set_defaults(func=run_cache)
+
+    serve = subparsers.add_parser("serve", parents=[common, layout],
+                                  help="Service HTTP local : adresse JSON en entrée, PDF en sortie")
+    serve.add_argument("--host", default="127.0.0.1", help="Adresse d'écoute (défaut: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8765, help="Port (défaut: 8765, 0 = port libre)")
+    serve.add_argument("--font", help="Fichier .ttf/.ttc à utiliser à la place de fonts/")
+    serve.add_argument("--workers", type=int, default=0,
+                       help="Nombre de processus de rendu (défaut: 0 = nombre de cœurs)")
+    serve.add_argument("--queue-size", type=int, default=64,
+                       help="Demandes en attente au-delà desquelles le service répond 503 (défaut: 64)")
+    serve.set_defaults(func=run_serve)
+
+    book = subparsers.add_parser("book", parents=[common], help="Carnet d'adresses : import et recherche")
+    book.add_argument("action", choices=["stats", "import", "search"], nargs="?", default="stats")
+    book.add_argument("arguments", nargs="*", metavar="FICHIER|MOT",
+                      help="Fichiers CSV/JSONL à importer (colonnes: %s), ou mots à chercher" % ", ".join(BOOK_FIELDS))
+    book.add_argument("--book", help=f"Carnet à utiliser (défaut: {book_path()})")
+    book.add_argument("--format", choices=["csv", "jsonl"], help="Format d'entrée (déduit de l'extension par défaut)")
+    book.add_argument("--limit", type=int, default=20, help="Nombre maximum de résultats (défaut: 20)")
+    book.set_defaults(func=run_book)
+
+    postal = subparsers.add_parser("postal-index", parents=[common],
+                                   help="Compile le fichier KEN_ALL.CSV de Japan Post en index")
+    postal.add_argument("csv", help="KEN_ALL.CSV (https://www.post.japanpost.jp/zipcode/download.html)")
+    postal.add_argument("-o", "--output", help=f"Index à écrire (défaut: {postal_index_path()})")
+    postal.add_argument("--encoding", default="cp932", help="Encodage du CSV (défaut: cp932 / Shift_JIS)")
+    postal.set_defaults(func=run_postal_index)
+
+    return parser
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    # Sans argument (ou lancé depuis le Finder avec -psn_...) : interface graphique
+    if not argv or argv[0].startswith("-psn"):
+        argv = ["gui"]
+
+    args = build_parser().parse_args(argv)
+    if not getattr(args, "func", None):
+        build_parser().print_help()
+        return 2
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    STATS.enabled = bool(args.stats)
+
+    try:
+        if getattr(args, "templates", None):
+            envelope_templates()
+            load_templates(args.templates)
+        if getattr(args, "template", None):
+            select_template(args.template)
+        if getattr(args, "fallback_font", None):
+            set_fallback_fonts(args.fallback_font)
+    except (OSError, ValueError) as e:
+        log.error("%s", e)
+        return 1
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        return args.func(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            log.info("Profil écrit dans %s", args.profile)
+        if args.stats:
+            STATS.write_json(args.stats)
+            log.info("Statistiques écrites dans %s", args.stats)
+
+if __name__ == "__main__":
+    sys.exit(main())
 
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+# Recherche dans le carnet d'adresses (AddressBook.search)
+#
+#   python -m pytest tests
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import envejp
+
+CONTACTS = [
+    {"postal_code": "160-0007", "address1": "東京都新宿区 荒木町11-1", "address2": "",
+     "company": "株式会社サンプル", "recipient": "山田様"},
+    {"postal_code": "100-0001", "address1": "東京都千代田区千代田1-1", "address2": "",
+     "company": "有限会社テスト", "recipient": "佐藤様"},
+]
+
+class SearchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.book = envejp.AddressBook(os.path.join(self.tmp.name, "book.db"))
+        self.book.import_records(CONTACTS)
+
+    def tearDown(self):
+        self.book.close()
+        self.tmp.cleanup()
+
+    def ids(self, query):
+        return [contact_id for contact_id, _ in self.book.search(query)]
+
+    def test_short_term_without_prefix_key(self):
+        # 荒木 commence un mot de l'adresse, 11 ne commence aucune clé
+        self.assertEqual(self.ids("荒木 11"), [1])
+        self.assertEqual(self.ids("11 荒木"), [1])
+        self.assertEqual(self.ids("新宿 荒木"), [1])
+
+    def test_no_term_starts_a_key(self):
+        self.assertEqual(self.ids("11"), [1])
+        self.assertEqual(self.ids("zz 荒木"), [])
+
+if __name__ == "__main__":
+    unittest.main()